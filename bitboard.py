@@ -0,0 +1,78 @@
+""" Breadth-first search with the whole board packed into one Python int
+
+Every cell of the obstacle grid is a bit, row after row, with two always
+empty guard columns at the end of each row so that a move off the side of
+the board lands on a guard bit instead of wrapping into the next row. A
+knight move is then a shift of the whole frontier by row * stride + column,
+and dropping obstacles and visited cells is a single AND. Each bfs layer
+costs a handful of big int operations rather than a Python loop over cells,
+and unlike the wavefront engine it needs nothing outside the standard
+library.
+"""
+from typing import Optional
+from mazes import Maze, MazeLocation
+
+GUARD_COLUMNS = 2  # a knight moves at most 2 columns
+# obstacle grid bytes to bit characters
+_FREE_CHARS: bytes = bytes.maketrans(b'\x00\x01', b'10')
+
+
+class BitBoard:
+    """ The free cells of a maze as an int, bit row * stride + column """
+
+    def __init__(self, maze: Maze) -> None:
+        self.maze: Maze = maze
+        self.rows, self.columns = maze.grid_shape
+        self.stride: int = self.columns + GUARD_COLUMNS
+        # '1' for free cells, '0' for obstacles and guards, most significant
+        # (last) cell first, which int() reads in linear time for base 2
+        cells: bytes = bytes(maze.obstacle_grid()).translate(_FREE_CHARS)
+        guard: bytes = b'0' * GUARD_COLUMNS
+        text: bytes = b''.join(cells[r * self.columns:(r + 1) * self.columns] + guard
+                               for r in range(self.rows))
+        self.free: int = int(text[::-1], 2) if text else 0
+
+    def bit(self, location: MazeLocation) -> int:
+        """ Bit number of a location, -1 if it's off the board """
+        index: int = self.maze.location_index(location)
+        if index < 0:
+            return -1
+        row, column = divmod(index, self.columns)
+        return row * self.stride + column
+
+    def moves(self, start: MazeLocation, goal: MazeLocation) -> Optional[int]:
+        """ Number of moves from start to goal, None if unreachable """
+        start_bit: int = self.bit(start)
+        goal_bit: int = self.bit(goal)
+        if start_bit < 0 or goal_bit < 0:
+            raise ValueError(f'{start} or {goal} is outside of the board')
+        if start_bit == goal_bit:
+            return 0
+        goal_mask: int = 1 << goal_bit
+        if not self.free & goal_mask:
+            return None
+
+        near: int = self.stride       # one row, for the moves of 2 columns
+        far: int = 2 * self.stride    # two rows, for the moves of 1 column
+        frontier: int = 1 << start_bit
+        unvisited: int = self.free & ~frontier
+        moves: int = 0
+        while frontier:
+            moves += 1
+            # the 8 moves as (+-1 column) then +-2 rows, (+-2 columns) then
+            # +-1 row; bits shifted below 0 were moves off the board anyway
+            one: int = (frontier << 1) | (frontier >> 1)
+            two: int = (frontier << 2) | (frontier >> 2)
+            frontier = ((one << far) | (one >> far) | (two << near) |
+                        (two >> near)) & unvisited
+            if frontier & goal_mask:
+                return moves
+            unvisited ^= frontier
+        return None
+
+
+def bitboard_bfs(maze: Maze, start: Optional[MazeLocation] = None,
+                 goal: Optional[MazeLocation] = None) -> Optional[int]:
+    """ Number of moves from start to goal (by default the maze's own) """
+    return BitBoard(maze).moves(start if start is not None else maze.start,
+                                goal if goal is not None else maze.goal)
@@ -1,13 +1,18 @@
 from __future__ import annotations
-from typing import Generic, TypeVar, List, Optional, Deque, Callable, Set, Dict
-from heapq import heappop, heappush
-# from maze_graphics import MazeWin
+from typing import Generic, TypeVar, List, Optional, Deque, Callable, Set, Dict, \
+    Iterable, Iterator, Tuple
+from heapq import heappop, heappush, heapify
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
+from time import perf_counter
+from collections import Counter
+import logging
 
 
 T = TypeVar('T')
 # TODO: Learn what Djikstra's Algorithm is and how it varies from astar.
 # TODO: Figure out where to jot down ideas about how to make KNIGHTS work better
-# TODO: Think about scanning larger chunks of the maze first
 
 class PriorityQueue(Generic[T]):
     def __init__(self) -> None:
@@ -26,10 +31,141 @@ class PriorityQueue(Generic[T]):
     def list(self):
         return self._container
 
+    def __len__(self) -> int:
+        return len(self._container)
+
     def __repr__(self):
         return repr(self._container)
 
 
+class BucketQueue(Generic[T]):
+    """ Priority queue for astar nodes whose cost + heuristic is a small
+    non-negative integer (unit moves and an integer heuristic).
+
+    Nodes are dropped in a list per priority, so push and pop are O(1)
+    and never compare nodes. Nodes of equal priority come out last in,
+    first out, which favors the deepest ones.
+    """
+    def __init__(self) -> None:
+        self._buckets: List[List[T]] = []
+        self._lowest: int = 0
+        self._size: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not self._size
+
+    def push(self, item: T) -> None:
+        priority: int = int(item.cost + item.heuristic)
+        while priority >= len(self._buckets):
+            self._buckets.append([])
+        self._buckets[priority].append(item)
+        if priority < self._lowest:
+            self._lowest = priority
+        self._size += 1
+
+    def pop(self) -> T:
+        while not self._buckets[self._lowest]:
+            self._lowest += 1
+        self._size -= 1
+        return self._buckets[self._lowest].pop()
+
+    def list(self):
+        return [item for bucket in self._buckets for item in bucket]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return repr(self.list())
+
+
+class IndexedHeap(Generic[T]):
+    """ d-ary heap of astar nodes holding at most one node per state.
+
+    Pushing a node for a state that is already queued replaces the queued
+    node if the new one is cheaper (a true decrease-key) and is dropped
+    otherwise, so nothing stale is ever popped.
+    """
+    ARITY = 4
+
+    def __init__(self) -> None:
+        self._nodes: List[T] = []
+        self._priorities: List[float] = []
+        self._position: Dict = {}  # state -> index in _nodes
+
+    @property
+    def empty(self) -> bool:
+        return not self._nodes
+
+    def push(self, item: T) -> None:
+        priority: float = item.cost + item.heuristic
+        i: Optional[int] = self._position.get(item.state)
+        if i is None:
+            i = len(self._nodes)
+            self._nodes.append(item)
+            self._priorities.append(priority)
+        elif priority < self._priorities[i]:
+            self._nodes[i] = item
+            self._priorities[i] = priority
+        else:
+            return
+        self._sift_up(i, item, priority)
+
+    def pop(self) -> T:
+        top: T = self._nodes[0]
+        del self._position[top.state]
+        last: T = self._nodes.pop()
+        last_priority: float = self._priorities.pop()
+        if self._nodes:
+            self._sift_down(0, last, last_priority)
+        return top
+
+    def _sift_up(self, i: int, item: T, priority: float) -> None:
+        nodes, priorities, position = self._nodes, self._priorities, self._position
+        while i > 0:
+            parent: int = (i - 1) // IndexedHeap.ARITY
+            if priorities[parent] <= priority:
+                break
+            nodes[i] = nodes[parent]
+            priorities[i] = priorities[parent]
+            position[nodes[i].state] = i
+            i = parent
+        nodes[i] = item
+        priorities[i] = priority
+        position[item.state] = i
+
+    def _sift_down(self, i: int, item: T, priority: float) -> None:
+        nodes, priorities, position = self._nodes, self._priorities, self._position
+        size: int = len(nodes)
+        while True:
+            first: int = i * IndexedHeap.ARITY + 1
+            if first >= size:
+                break
+            best: int = first
+            for child in range(first + 1, min(first + IndexedHeap.ARITY, size)):
+                if priorities[child] < priorities[best]:
+                    best = child
+            if priorities[best] >= priority:
+                break
+            nodes[i] = nodes[best]
+            priorities[i] = priorities[best]
+            position[nodes[i].state] = i
+            i = best
+        nodes[i] = item
+        priorities[i] = priority
+        position[item.state] = i
+
+    def list(self):
+        return self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __repr__(self) -> str:
+        return repr(self._nodes)
+
+
 class Stack(Generic[T]):
     def __init__(self) -> None:
         self._container: List[T] = []
@@ -48,6 +184,9 @@ class Stack(Generic[T]):
     def list(self):
         return self._container
 
+    def __len__(self) -> int:
+        return len(self._container)
+
     def __repr__(self) -> str:
         return repr(self._container)
 
@@ -69,11 +208,40 @@ class Queue(Generic[T]):
     def list(self):
         return self._container
 
+    def __len__(self) -> int:
+        return len(self._container)
+
     def __repr__(self) -> str:
         return repr(self._container)
 
 
+@dataclass
+class SearchStats:
+    expansions: int = 0  # states passed to successors
+    pushes: int = 0  # nodes added to the frontier
+    peak_frontier: int = 0  # most nodes in the frontier at once
+    peak_explored: int = 0  # states reached, explored never shrinks
+    heuristic_evaluations: int = 0
+    re_expansions: int = 0  # expansions of a state that was expanded before
+    stale_skipped: int = 0  # popped nodes already superseded by a cheaper one
+    phase_times: Dict[str, float] = field(default_factory=dict)  # seconds
+
+
+def _record_stats(stats: SearchStats, started: float, **counts: int) -> None:
+    """ Add the counts of one search to stats, so that one SearchStats can
+    total several searches """
+    for name, count in counts.items():
+        if name.startswith('peak_'):
+            setattr(stats, name, max(count, getattr(stats, name)))
+        else:
+            setattr(stats, name, count + getattr(stats, name))
+    stats.phase_times['search'] = \
+        stats.phase_times.get('search', 0.0) + perf_counter() - started
+
+
 class Node(Generic[T]):
+    __slots__ = ('state', 'parent', 'cost', 'heuristic')
+
     def __init__(self, state: T, parent: Optional[Node], cost: float = 0.0,
                  heuristic: float = 0.0) -> None:
         self.state: T = state
@@ -85,104 +253,896 @@ class Node(Generic[T]):
         return (self.cost + self.heuristic) < (other.cost + other.heuristic)
 
 
+class SearchHooks(Generic[T]):
+    """ Callbacks for watching a search as it runs; override the ones you
+    need. Searches run a separate loop when hooks are attached, so a
+    search without hooks doesn't pay for them at all. """
+    def on_push(self, node: Node[T]) -> None:
+        pass
+
+    def on_expand(self, node: Node[T], frontier) -> None:
+        """ Called once node's successors have been pushed """
+        pass
+
+    def on_goal(self, node: Node[T]) -> None:
+        pass
+
+    def on_exhausted(self) -> None:
+        pass
+
+
+class HookChain(SearchHooks[T]):
+    """ Passes every event on to several hooks in turn """
+    def __init__(self, *hooks: SearchHooks[T]) -> None:
+        self.hooks = hooks
+
+    def on_push(self, node: Node[T]) -> None:
+        for hook in self.hooks:
+            hook.on_push(node)
+
+    def on_expand(self, node: Node[T], frontier) -> None:
+        for hook in self.hooks:
+            hook.on_expand(node, frontier)
+
+    def on_goal(self, node: Node[T]) -> None:
+        for hook in self.hooks:
+            hook.on_goal(node)
+
+    def on_exhausted(self) -> None:
+        for hook in self.hooks:
+            hook.on_exhausted()
+
+
+class LoggingHooks(SearchHooks[T]):
+    def __init__(self, logger: Optional[logging.Logger] = None,
+                 level: int = logging.DEBUG) -> None:
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.level = level
+
+    def on_push(self, node: Node[T]) -> None:
+        self.logger.log(self.level, 'push %s', node.state)
+
+    def on_expand(self, node: Node[T], frontier) -> None:
+        self.logger.log(self.level, 'expand %s (%d in frontier)',
+                        node.state, len(frontier))
+
+    def on_goal(self, node: Node[T]) -> None:
+        self.logger.info('reached goal %s after %d moves',
+                         node.state, path_length(node))
+
+    def on_exhausted(self) -> None:
+        self.logger.info('search exhausted without reaching the goal')
+
+
+class ProfilingHooks(SearchHooks[T]):
+    """ Counts events and times the gaps between expansions """
+    def __init__(self) -> None:
+        self.counts: Counter = Counter()
+        self.expansion_times: List[float] = []
+        self._last: float = perf_counter()
+
+    def on_push(self, node: Node[T]) -> None:
+        self.counts['push'] += 1
+
+    def on_expand(self, node: Node[T], frontier) -> None:
+        now: float = perf_counter()
+        self.counts['expand'] += 1
+        self.expansion_times.append(now - self._last)
+        self._last = now
+
+    def on_goal(self, node: Node[T]) -> None:
+        self.counts['goal'] += 1
+
+    def on_exhausted(self) -> None:
+        self.counts['exhausted'] += 1
+
+
 def dfs(initial: T, goal_test: Callable[[T], bool],
         successors: Callable[[T], List[T]],
-        graphics: Optional[MazeWin] = None) -> Optional[Node[T]]:
-    # The line below is literally the only line that's different from bfs:
-    frontier: Stack[Node[T]] = Stack()
+        hooks: Optional[SearchHooks[T]] = None,
+        stats: Optional[SearchStats] = None) -> Optional[Node[T]]:
+    # The Stack is literally the only thing that's different from bfs:
+    if hooks is None:
+        return _uninformed_search(Stack(), initial, goal_test, successors, stats)
+    return _uninformed_search_hooked(Stack(), initial, goal_test, successors,
+                                     hooks, stats)
+
+
+def bfs(initial: T, goal_test: Callable[[T], bool],
+        successors: Callable[[T], List[T]],
+        hooks: Optional[SearchHooks[T]] = None,
+        stats: Optional[SearchStats] = None) -> Optional[Node[T]]:
+    # The Queue is literally the only thing that's different from dfs:
+    if hooks is None:
+        return _uninformed_search(Queue(), initial, goal_test, successors, stats)
+    return _uninformed_search_hooked(Queue(), initial, goal_test, successors,
+                                     hooks, stats)
+
+
+def _uninformed_search(frontier, initial: T, goal_test: Callable[[T], bool],
+                       successors: Callable[[T], List[T]],
+                       stats: Optional[SearchStats]) -> Optional[Node[T]]:
+    started: float = perf_counter()
     frontier.push(Node(initial, None))
     # explored is where we have been
     explored: Set[T] = {initial}
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
 
-    steps_considered = 0
+    solution: Optional[Node[T]] = None
     # keep going while we can still explore
     while not frontier.empty:
-        steps_considered += 1
         current_node: Node[T] = frontier.pop()
         current_state: T = current_node.state
 
         # see if we're there yet
         if goal_test(current_state):
-            print(f'BFS reached goal after consideration of {steps_considered} possible moves.')
-            return current_node
+            solution = current_node
+            break
 
         # see where we can go next
         # but haven't already been
-        child = None
+        expansions += 1
         for child in successors(current_state):
             if child in explored:
                 continue
             explored.add(child)
             frontier.push(Node(child, current_node))
-        if graphics:
-            graphics.show_search(current_state, frontier, child)
+            pushes += 1
+        if len(frontier) > peak_frontier:
+            peak_frontier = len(frontier)
 
-    print(f'BFS failed to reach goal after consideration of {steps_considered} possible moves.')
-    return None  # if all options exhausted
+    if stats is not None:
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_frontier, peak_explored=len(explored))
+    return solution  # None if all options exhausted
 
 
-def bfs(initial: T, goal_test: Callable[[T], bool],
-        successors: Callable[[T], List[T]],
-        graphics: Optional[MazeWin] = None) -> Optional[Node[T]]:
-    # The line below is literally the only line that's different from dfs:
-    frontier: Queue[Node[T]] = Queue()
-    frontier.push(Node(initial, None))
-    # explored is where we have been
+def _uninformed_search_hooked(frontier, initial: T,
+                              goal_test: Callable[[T], bool],
+                              successors: Callable[[T], List[T]],
+                              hooks: SearchHooks[T],
+                              stats: Optional[SearchStats]) -> Optional[Node[T]]:
+    """ _uninformed_search, calling hooks along the way """
+    started: float = perf_counter()
+    node: Node[T] = Node(initial, None)
+    frontier.push(node)
+    hooks.on_push(node)
     explored: Set[T] = {initial}
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
 
-    steps_considered = 0
-    # keep going while we can still explore
+    solution: Optional[Node[T]] = None
     while not frontier.empty:
-        steps_considered += 1
         current_node: Node[T] = frontier.pop()
         current_state: T = current_node.state
 
-        # see if we're there yet
         if goal_test(current_state):
-            return current_node
+            solution = current_node
+            break
 
-        # see where we can go next
-        # but haven't already been
-        child = None
+        expansions += 1
         for child in successors(current_state):
             if child in explored:
                 continue
             explored.add(child)
-            frontier.push(Node(child, current_node))
-        if graphics:
-            graphics.show_search(current_state, frontier, child)
+            node = Node(child, current_node)
+            frontier.push(node)
+            hooks.on_push(node)
+            pushes += 1
+        if len(frontier) > peak_frontier:
+            peak_frontier = len(frontier)
+        hooks.on_expand(current_node, frontier)
 
-    print(f'BFS failed to reach goal after consideration of {steps_considered} possible moves.')
-    return None  # if all options exhausted
+    if solution is not None:
+        hooks.on_goal(solution)
+    else:
+        hooks.on_exhausted()
+    if stats is not None:
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_frontier, peak_explored=len(explored))
+    return solution
 
 
 def astar(initial: T, goal_test: Callable[[T], bool],
           successors: Callable[[T], List[T]], heuristic: Callable[[T], float],
-          graphics: Optional[MazeWin] = None) -> Optional[Node[T]]:
-    frontier: PriorityQueue[Node[T]] = PriorityQueue()
+          hooks: Optional[SearchHooks[T]] = None,
+          queue: Callable[[], PriorityQueue] = PriorityQueue,
+          stats: Optional[SearchStats] = None) -> Optional[Node[T]]:
+    # queue=BucketQueue needs an integer heuristic, see BucketQueue
+    if hooks is None:
+        return _astar(initial, goal_test, successors, heuristic, queue(), stats)
+    return _astar_hooked(initial, goal_test, successors, heuristic, queue(),
+                         hooks, stats)
+
+
+def _astar(initial: T, goal_test: Callable[[T], bool],
+           successors: Callable[[T], List[T]], heuristic: Callable[[T], float],
+           frontier: PriorityQueue[Node[T]],
+           stats: Optional[SearchStats]) -> Optional[Node[T]]:
+    started: float = perf_counter()
     frontier.push(Node(initial, None, 0.0, heuristic(initial)))
+    # the cheapest cost found so far for every state reached
     explored: Dict[T, float] = {initial: 0.0}
+    closed: Set[T] = set()
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
+    re_expansions: int = 0
+    stale_skipped: int = 0
 
+    solution: Optional[Node[T]] = None
     while not frontier.empty:
         current_node: Node[T] = frontier.pop()
         current_state: T = current_node.state
+        if current_node.cost > explored[current_state]:
+            stale_skipped += 1
+            continue  # a cheaper node for this state came along later
 
         if goal_test(current_state):
-            return current_node
+            solution = current_node
+            break
+
+        expansions += 1
+        if current_state in closed:
+            re_expansions += 1  # only happens with an inconsistent heuristic
+        else:
+            closed.add(current_state)
 
-        child = None
         for child in successors(current_state):
             new_cost: float = current_node.cost + 1
 
             if child not in explored or explored[child] > new_cost:
                 explored[child] = new_cost
                 frontier.push(Node(child, current_node, new_cost, heuristic(child)))
-        if graphics:
-            graphics.show_search(current_state, frontier, child)
+                pushes += 1
+        if len(frontier) > peak_frontier:
+            peak_frontier = len(frontier)
+
+    if stats is not None:
+        # every node pushed had its heuristic evaluated once
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_frontier, peak_explored=len(explored),
+                      heuristic_evaluations=pushes, re_expansions=re_expansions,
+                      stale_skipped=stale_skipped)
+    return solution
+
+
+def _astar_hooked(initial: T, goal_test: Callable[[T], bool],
+                  successors: Callable[[T], List[T]],
+                  heuristic: Callable[[T], float],
+                  frontier: PriorityQueue[Node[T]], hooks: SearchHooks[T],
+                  stats: Optional[SearchStats]) -> Optional[Node[T]]:
+    """ _astar, calling hooks along the way """
+    started: float = perf_counter()
+    node: Node[T] = Node(initial, None, 0.0, heuristic(initial))
+    frontier.push(node)
+    hooks.on_push(node)
+    explored: Dict[T, float] = {initial: 0.0}
+    closed: Set[T] = set()
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
+    re_expansions: int = 0
+    stale_skipped: int = 0
+
+    solution: Optional[Node[T]] = None
+    while not frontier.empty:
+        current_node: Node[T] = frontier.pop()
+        current_state: T = current_node.state
+        if current_node.cost > explored[current_state]:
+            stale_skipped += 1
+            continue
+
+        if goal_test(current_state):
+            solution = current_node
+            break
+
+        expansions += 1
+        if current_state in closed:
+            re_expansions += 1
+        else:
+            closed.add(current_state)
+
+        for child in successors(current_state):
+            new_cost: float = current_node.cost + 1
+
+            if child not in explored or explored[child] > new_cost:
+                explored[child] = new_cost
+                node = Node(child, current_node, new_cost, heuristic(child))
+                frontier.push(node)
+                hooks.on_push(node)
+                pushes += 1
+        if len(frontier) > peak_frontier:
+            peak_frontier = len(frontier)
+        hooks.on_expand(current_node, frontier)
+
+    if solution is not None:
+        hooks.on_goal(solution)
+    else:
+        hooks.on_exhausted()
+    if stats is not None:
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_frontier, peak_explored=len(explored),
+                      heuristic_evaluations=pushes, re_expansions=re_expansions,
+                      stale_skipped=stale_skipped)
+    return solution
+
+
+def astar_weighted(initial: T, goal_test: Callable[[T], bool],
+                   successors: Callable[[T], Iterable[Tuple[T, float]]],
+                   heuristic: Callable[[T], float],
+                   stats: Optional[SearchStats] = None) -> Optional[Node[T]]:
+    """ astar for moves of different costs: successors gives (state, cost)
+    pairs. (The weights are on the moves, not on the heuristic as in
+    anytime_astar.) The solution's cost is the total of its moves. """
+    started: float = perf_counter()
+    frontier: PriorityQueue[Node[T]] = PriorityQueue()
+    frontier.push(Node(initial, None, 0.0, heuristic(initial)))
+    explored: Dict[T, float] = {initial: 0.0}
+    closed: Set[T] = set()
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
+    re_expansions: int = 0
+    stale_skipped: int = 0
+
+    solution: Optional[Node[T]] = None
+    while not frontier.empty:
+        current_node: Node[T] = frontier.pop()
+        current_state: T = current_node.state
+        if current_node.cost > explored[current_state]:
+            stale_skipped += 1
+            continue
+
+        if goal_test(current_state):
+            solution = current_node
+            break
+
+        expansions += 1
+        if current_state in closed:
+            re_expansions += 1  # only happens with an inconsistent heuristic
+        else:
+            closed.add(current_state)
+        for child, move_cost in successors(current_state):
+            new_cost: float = current_node.cost + move_cost
+            if child not in explored or explored[child] > new_cost:
+                explored[child] = new_cost
+                frontier.push(Node(child, current_node, new_cost, heuristic(child)))
+                pushes += 1
+        if len(frontier) > peak_frontier:
+            peak_frontier = len(frontier)
+
+    if stats is not None:
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_frontier, peak_explored=len(explored),
+                      heuristic_evaluations=pushes, re_expansions=re_expansions,
+                      stale_skipped=stale_skipped)
+    return solution
+
+
+def ida_star(initial: T, goal_test: Callable[[T], bool],
+             successors: Callable[[T], List[T]], heuristic: Callable[[T], float],
+             table_size: int = 0,
+             stats: Optional[SearchStats] = None) -> Optional[Node[T]]:
+    """ Iterative deepening A*: depth-first searches out to a bound on
+    cost + heuristic, raising the bound to the smallest value that was
+    cut off until the goal is found. With an admissible heuristic the
+    first path found is a shortest one.
+
+    Only the current path is kept, so memory is O(depth) rather than the
+    whole frontier and explored set of astar. The price is searching the
+    same states again, both in every iteration and whenever a state can be
+    reached along more than one path. table_size > 0 remembers the lowest
+    cost each of up to that many states was reached at in an iteration, and
+    skips them when they come up again no cheaper. In stats, peak_frontier
+    is the longest path held and peak_explored the fullest table.
+    """
+    started: float = perf_counter()
+    bound: float = heuristic(initial)
+    expansions: int = 0
+    pushes: int = 0
+    peak_depth: int = 1
+    peak_table: int = 0
+    evaluations: int = 1
+
+    solution: Optional[List[T]] = [initial] if goal_test(initial) else None
+    while solution is None and bound < float('inf'):
+        # cost, plus the heuristic, of the states cut off by this bound
+        next_bound: float = float('inf')
+        table: Dict[T, int] = {}
+        path: List[T] = [initial]
+        on_path: Set[T] = {initial}
+        children: List = [iter(successors(initial))]  # one per path state
+        expansions += 1
+        while children:
+            child: Optional[T] = next(children[-1], None)
+            if child is None:
+                children.pop()
+                on_path.discard(path.pop())
+                continue
+            if child in on_path:
+                continue
+            cost: int = len(path)
+            if table_size:
+                seen: Optional[int] = table.get(child)
+                if seen is not None and seen <= cost:
+                    continue
+                if seen is not None or len(table) < table_size:
+                    table[child] = cost
+            f: float = cost + heuristic(child)
+            evaluations += 1
+            if f > bound:
+                if f < next_bound:
+                    next_bound = f
+                continue
+
+            path.append(child)
+            on_path.add(child)
+            pushes += 1
+            if goal_test(child):
+                solution = path
+                break
+            expansions += 1
+            children.append(iter(successors(child)))
+            if len(path) > peak_depth:
+                peak_depth = len(path)
+        if len(table) > peak_table:
+            peak_table = len(table)
+        bound = next_bound
+
+    if stats is not None:
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_depth, peak_explored=peak_table,
+                      heuristic_evaluations=evaluations)
+    return path_to_node(solution) if solution is not None else None
+
+
+def anytime_astar(initial: T, goal_test: Callable[[T], bool],
+                  successors: Callable[[T], List[T]],
+                  heuristic: Callable[[T], float], weight: float = 3.0,
+                  deadline: Optional[float] = None,
+                  stats: Optional[SearchStats] = None) -> Iterator[Tuple[Node[T], float]]:
+    """ Anytime Repairing A* (Likhachev, Gordon and Thrun): yields
+    (solution, bound) pairs, each solution no longer than the one before
+    and at most bound times as long as a shortest path.
+
+    The first search orders the frontier by cost + weight * heuristic,
+    which finds a path quickly. Every following one lowers the weight and
+    reuses the states already reached, only re-expanding those that got
+    cheaper. It ends once the bound reaches 1 (the path is a shortest one),
+    when the goal can't be reached (without yielding anything), or at
+    deadline, a perf_counter() time, once there is a first solution. Only
+    the first state found to pass goal_test is searched for.
+    """
+    started: float = perf_counter()
+    g: Dict[T, float] = {initial: 0.0}
+    h: Dict[T, float] = {initial: heuristic(initial)}
+    parents: Dict[T, Optional[T]] = {initial: None}
+    # heap of (cost + weight * heuristic, tie breaker, cost, state);
+    # entries whose cost is no longer the state's are stale
+    frontier: List = [(weight * h[initial], 0, 0.0, initial)]
+    inconsistent: Dict[T, None] = {}  # closed states that got cheaper
+    goal: Optional[T] = initial if goal_test(initial) else None
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
+
+    try:
+        while True:
+            closed: Set[T] = set()
+            # improve the path until nothing left is cheaper at this weight
+            while frontier:
+                key, _, cost, state = frontier[0]
+                if cost != g[state] or state in closed:
+                    heappop(frontier)  # stale
+                    continue
+                if goal is not None and (g[goal] <= key or (
+                        deadline is not None and perf_counter() > deadline)):
+                    break
+                heappop(frontier)
+                closed.add(state)
+                expansions += 1
+                if goal is None and goal_test(state):
+                    goal = state
+                    continue
+                new_cost: float = cost + 1
+                for child in successors(state):
+                    if new_cost < g.get(child, float('inf')):
+                        g[child] = new_cost
+                        parents[child] = state
+                        if child not in h:
+                            h[child] = heuristic(child)
+                        if goal is None and goal_test(child):
+                            goal = child
+                        if child in closed:
+                            inconsistent[child] = None
+                        else:
+                            pushes += 1
+                            heappush(frontier, (new_cost + weight * h[child],
+                                                pushes, new_cost, child))
+                if len(frontier) > peak_frontier:
+                    peak_frontier = len(frontier)
+            if goal is None:
+                break  # unreachable
+
+            # the states left to expand; none of them can lead to a path
+            # shorter than their cost + heuristic
+            waiting: Set[T] = {state for _, _, cost, state in frontier
+                               if cost == g[state] and state not in closed}
+            waiting.update(inconsistent)
+            inconsistent.clear()
+            lower: float = min((g[state] + h[state] for state in waiting),
+                               default=g[goal])
+            bound: float = min(weight, g[goal] / lower) if lower > 0 else 1.0
+            path: List[T] = [goal]
+            while parents[path[-1]] is not None:
+                path.append(parents[path[-1]])
+            path.reverse()
+            yield path_to_node(path), max(bound, 1.0)
+            if bound <= 1.0 or (deadline is not None and perf_counter() > deadline):
+                break
+
+            weight = 1.0 + (weight - 1.0) / 2
+            if weight < 1.05:
+                weight = 1.0
+            frontier = [(g[state] + weight * h[state], n, g[state], state)
+                        for n, state in enumerate(waiting, pushes + 1)]
+            pushes += len(frontier)
+            heapify(frontier)
+    finally:
+        # also when the caller stops asking for better solutions
+        if stats is not None:
+            _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                          peak_frontier=peak_frontier, peak_explored=len(g),
+                          heuristic_evaluations=len(h))
+
+
+def bidirectional_bfs(initial: T, goal: T,
+                      successors: Callable[[T], List[T]]) -> Optional[Node[T]]:
+    """ bfs from both ends, a whole layer at a time, always growing the
+    smaller of the two frontiers.
+
+    successors has to be symmetric (every move can be undone), as it is
+    for knight moves. The first state reached by both searches lies on a
+    shortest path: every state in the layer being grown is one step past
+    the deepest layer searched so far, so no shorter meeting was missed.
+    A goal that can't be entered (an obstacle, which may still have moves
+    out of it) breaks the symmetry, so it's checked for up front.
+    """
+    if initial == goal:
+        return Node(initial, None)
+    if not any(goal in successors(state) for state in successors(goal)):
+        return None
+    # parents towards initial, and towards goal
+    forward: Dict[T, Optional[T]] = {initial: None}
+    backward: Dict[T, Optional[T]] = {goal: None}
+    forward_layer: List[T] = [initial]
+    backward_layer: List[T] = [goal]
+
+    while forward_layer and backward_layer:
+        if len(forward_layer) <= len(backward_layer):
+            forward_layer, meeting = _grow_layer(forward_layer, forward,
+                                                 backward, successors)
+        else:
+            backward_layer, meeting = _grow_layer(backward_layer, backward,
+                                                  forward, successors)
+        if meeting is not None:
+            return _join_paths(meeting, forward, backward)
+
+    return None  # one side ran out of places to go
+
+
+def _grow_layer(layer: List[T], parents: Dict[T, Optional[T]],
+                other: Dict[T, Optional[T]],
+                successors: Callable[[T], List[T]]):
+    next_layer: List[T] = []
+    for state in layer:
+        for child in successors(state):
+            if child in parents:
+                continue
+            parents[child] = state
+            if child in other:
+                return next_layer, child
+            next_layer.append(child)
+    return next_layer, None
+
+
+def _join_paths(meeting: T, forward: Dict[T, Optional[T]],
+                backward: Dict[T, Optional[T]]) -> Node[T]:
+    path: List[T] = [meeting]
+    while forward[path[-1]] is not None:
+        path.append(forward[path[-1]])
+    path.reverse()
+    while backward[path[-1]] is not None:
+        path.append(backward[path[-1]])
+    return path_to_node(path)
+
+
+class LifelongAStar(Generic[T]):
+    """ Lifelong Planning A* (Koenig and Likhachev): an astar that repairs
+    its previous search when states are blocked or freed, instead of
+    starting over.
+
+    successors has to be symmetric, as knight moves are, since it also
+    serves as the predecessors. passable says whether a state may be
+    entered. After changing which states are passable, hand them to
+    update(); the next plan() then only re-expands the states whose
+    distance from initial actually changed.
+    """
+    INFINITY = float('inf')
+
+    def __init__(self, initial: T, goal: T, successors: Callable[[T], List[T]],
+                 heuristic: Callable[[T], float],
+                 passable: Callable[[T], bool] = lambda state: True) -> None:
+        self.initial: T = initial
+        self.goal: T = goal
+        self.successors = successors
+        self.heuristic = heuristic
+        self.passable = passable
+        self._g: Dict[T, float] = {}
+        self._rhs: Dict[T, float] = {initial: 0.0}
+        # heap of (key, tie breaker, state), and the current key of every
+        # state that belongs in it: entries that don't match are stale
+        self._frontier: List = []
+        self._keys: Dict[T, tuple] = {}
+        self._pushes: int = 0
+        self._push(initial)
+
+    def plan(self, stats: Optional[SearchStats] = None) -> Optional[Node[T]]:
+        """ The shortest path from initial to goal as things stand now """
+        started: float = perf_counter()
+        expansions: int = 0
+        g, rhs = self._g, self._rhs
+        while True:
+            top: Optional[tuple] = self._top_key()
+            goal_g: float = g.get(self.goal, self.INFINITY)
+            if top is None or (top >= self._key(self.goal) and
+                               rhs.get(self.goal, self.INFINITY) == goal_g):
+                break
+            _, _, state = heappop(self._frontier)
+            del self._keys[state]
+            expansions += 1
+            if g.get(state, self.INFINITY) > rhs.get(state, self.INFINITY):
+                g[state] = rhs[state]
+                for child in self.successors(state):
+                    self._update_state(child)
+            else:
+                g[state] = self.INFINITY
+                self._update_state(state)
+                for child in self.successors(state):
+                    self._update_state(child)
+
+        if stats is not None:
+            _record_stats(stats, started, expansions=expansions,
+                          peak_explored=len(g))
+        if g.get(self.goal, self.INFINITY) == self.INFINITY:
+            return None
+        return path_to_node(self._path())
+
+    def update(self, changed: Iterable[T]) -> None:
+        """ Tell the planner that the states in changed were blocked or
+        freed since the last plan() """
+        for state in changed:
+            self._update_state(state)
+            for child in self.successors(state):
+                self._update_state(child)
+
+    def _path(self) -> List[T]:
+        # walk back from the goal along predecessors one move closer
+        g = self._g
+        path: List[T] = [self.goal]
+        while path[-1] != self.initial:
+            path.append(min(self.successors(path[-1]),
+                            key=lambda p: g.get(p, self.INFINITY)))
+        path.reverse()
+        return path
+
+    def _key(self, state: T) -> tuple:
+        best: float = min(self._g.get(state, self.INFINITY),
+                          self._rhs.get(state, self.INFINITY))
+        return best + self.heuristic(state), best
+
+    def _top_key(self) -> Optional[tuple]:
+        frontier = self._frontier
+        while frontier:
+            key, _, state = frontier[0]
+            if self._keys.get(state) == key:
+                return key
+            heappop(frontier)  # stale
+        return None
+
+    def _push(self, state: T) -> None:
+        key: tuple = self._key(state)
+        self._keys[state] = key
+        self._pushes += 1
+        heappush(self._frontier, (key, self._pushes, state))
+
+    def _update_state(self, state: T) -> None:
+        if state != self.initial:
+            if not self.passable(state):
+                self._rhs[state] = self.INFINITY
+            else:
+                g = self._g
+                self._rhs[state] = min(
+                    (g.get(p, self.INFINITY) + 1 for p in self.successors(state)),
+                    default=self.INFINITY)
+        self._keys.pop(state, None)
+        if self._g.get(state, self.INFINITY) != self._rhs.get(state, self.INFINITY):
+            self._push(state)
+
+
+class SearchBuffers:
+    """ Parent and cost arrays for the indexed searches, allocated once per
+    compiled maze and reused by every search on it.
+
+    Entries are only valid when their stamp matches the current search,
+    so starting a new search doesn't have to clear the arrays.
+    """
+    __slots__ = ('parent', 'cost', 'heuristic', 'stamp', 'search')
+
+    def __init__(self, size: int) -> None:
+        self.parent: array = array('i', [0]) * size
+        self.cost: array = array('i', [0]) * size
+        self.heuristic: array = array('i', [0]) * size
+        self.stamp: array = array('i', [0]) * size
+        self.search: int = 0
+
+    def next_search(self) -> int:
+        self.search += 1
+        if self.search == 2 ** 31 - 1:
+            self.stamp = array('i', [0]) * len(self.stamp)
+            self.search = 1
+        return self.search
+
+    def path(self, goal: int) -> List[int]:
+        path: List[int] = [goal]
+        while self.parent[path[-1]] != path[-1]:
+            path.append(self.parent[path[-1]])
+        path.reverse()
+        return path
+
+
+def bfs_indexed(initial: int, goal: int, offsets: array, neighbors: array,
+                buffers: Optional[SearchBuffers] = None) -> Optional[List[int]]:
+    """ bfs over integer states with a flat (CSR) adjacency, where the
+    successors of state i are neighbors[offsets[i]:offsets[i + 1]].
+
+    Afterwards buffers.cost[goal] holds the length of the path.
+    """
+    if buffers is None:
+        buffers = SearchBuffers(len(offsets) - 1)
+    search: int = buffers.next_search()
+    stamp, parent, cost = buffers.stamp, buffers.parent, buffers.cost
+    stamp[initial] = search
+    parent[initial] = initial
+    cost[initial] = 0
+    frontier: Deque[int] = deque([initial])
+
+    while frontier:
+        current: int = frontier.popleft()
+        if current == goal:
+            return buffers.path(goal)
+
+        new_cost: int = cost[current] + 1
+        for k in range(offsets[current], offsets[current + 1]):
+            child = neighbors[k]
+            if stamp[child] != search:
+                stamp[child] = search
+                parent[child] = current
+                cost[child] = new_cost
+                frontier.append(child)
 
     return None
 
 
+def bfs_distances_indexed(source: int, offsets: array,
+                          neighbors: array) -> array:
+    """ Number of moves from source to every state of a flat (CSR)
+    adjacency, -1 where it can't be reached.
+
+    With symmetric moves this is also the distance from every state to
+    source. Stored as shorts unless distances could overflow them.
+    """
+    size: int = len(offsets) - 1
+    distances: array = array('h' if size < 2 ** 15 else 'i', [-1]) * size
+    distances[source] = 0
+    frontier: Deque[int] = deque([source])
+
+    while frontier:
+        current: int = frontier.popleft()
+        new_distance: int = distances[current] + 1
+        for k in range(offsets[current], offsets[current + 1]):
+            child = neighbors[k]
+            if distances[child] < 0:
+                distances[child] = new_distance
+                frontier.append(child)
+
+    return distances
+
+
+def astar_indexed(initial: int, goal: int, offsets: array, neighbors: array,
+                  heuristic: Callable[[int], int],
+                  buffers: Optional[SearchBuffers] = None,
+                  stats: Optional[SearchStats] = None) -> Optional[List[int]]:
+    """ astar over integer states with a flat (CSR) adjacency.
+
+    The heuristic has to return integers: heap entries are the plain ints
+    f * size + state, so nothing but an int is allocated per push.
+    Afterwards buffers.cost[goal] holds the length of the path.
+    """
+    started: float = perf_counter()
+    size: int = len(offsets) - 1
+    if buffers is None:
+        buffers = SearchBuffers(size)
+    search: int = buffers.next_search()
+    stamp, parent, cost, h = \
+        buffers.stamp, buffers.parent, buffers.cost, buffers.heuristic
+    stamp[initial] = search
+    parent[initial] = initial
+    cost[initial] = 0
+    h[initial] = heuristic(initial)
+    frontier: List[int] = [h[initial] * size + initial]
+    expansions: int = 0
+    pushes: int = 1
+    peak_frontier: int = 1
+    reached: int = 1
+    stale_skipped: int = 0
+
+    solution: Optional[List[int]] = None
+    while frontier:
+        f, current = divmod(heappop(frontier), size)
+        if f != cost[current] + h[current]:
+            stale_skipped += 1
+            continue  # a cheaper entry for this state was already popped
+        if current == goal:
+            solution = buffers.path(goal)
+            break
+
+        expansions += 1
+        new_cost: int = cost[current] + 1
+        for k in range(offsets[current], offsets[current + 1]):
+            child = neighbors[k]
+            if stamp[child] != search:
+                stamp[child] = search
+                h[child] = heuristic(child)
+                reached += 1
+            elif cost[child] <= new_cost:
+                continue
+            cost[child] = new_cost
+            parent[child] = current
+            heappush(frontier, (new_cost + h[child]) * size + child)
+            pushes += 1
+        if len(frontier) > peak_frontier:
+            peak_frontier = len(frontier)
+
+    if stats is not None:
+        _record_stats(stats, started, expansions=expansions, pushes=pushes,
+                      peak_frontier=peak_frontier, peak_explored=reached,
+                      heuristic_evaluations=reached, stale_skipped=stale_skipped)
+    return solution
+
+
+def path_length(node: Node[T]) -> int:
+    """ Number of moves from the initial state to node, without building
+    the path """
+    length: int = 0
+    while node.parent is not None:
+        node = node.parent
+        length += 1
+    return length
+
+
+def path_to_node(path: List[T]) -> Node[T]:
+    """ The Node chain for a path, the reverse of node_to_path() """
+    node: Optional[Node[T]] = None
+    for cost, state in enumerate(path):
+        node = Node(state, node, float(cost))
+    return node
+
+
 def node_to_path(node: Node[T]) -> List[T]:
     path: List[T] = [node.state]
     while node.parent is not None:
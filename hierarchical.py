@@ -0,0 +1,210 @@
+""" Hierarchical pathfinding (HPA*, Botea, Mueller and Schaeffer) for large
+boards with many queries
+
+The obstacle grid is cut into square clusters. The cells a knight can
+leave a cluster from are its entrances, and they make up an abstract graph:
+a move between two clusters is an edge of cost 1, and within a cluster
+every entrance is joined to every other one it can reach, at the cost of
+the shortest path that stays inside the cluster. Any path on the board
+alternates between stretches inside a cluster and moves between clusters,
+so the shortest path through the abstract graph is as short as the
+shortest path on the board, and a query only searches the entrances
+instead of every cell. Only the clusters along the way get refined into
+cell by cell paths.
+
+Clusters are worked out the first time a search reaches them, and kept
+until the obstacles change.
+
+This isn't one of KnightSolver's engines. A knight leaves a cluster from
+anywhere within two cells of its edge, so nearly half of a 16 x 16
+cluster's cells are entrances, and the abstract graph ends up barely
+smaller than the board while costing a bfs per entrance to build. Around
+a wall on a 200 x 200 board, a first query takes about 2s and later ones
+are still over ten times slower than the indexed astar.
+"""
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple, Deque
+from generic_search import astar_weighted, node_to_path, Node, SearchStats
+from mazes import Maze, MazeLocation, KNIGHT_MOVES, knight_moves
+
+Edge = Tuple[int, int]  # (cell, moves)
+
+
+class HierarchicalMaze:
+    def __init__(self, maze: Maze, cluster_size: int = 16) -> None:
+        self.maze: Maze = maze
+        self.cluster_size: int = cluster_size
+        self.rows, self.columns = maze.grid_shape
+        self._grid: bytearray = maze.obstacle_grid()
+        self._cluster_columns: int = -(-self.columns // cluster_size)
+        self._version: int = maze.version
+        # entrance -> moves to other clusters and paths to entrances of its own
+        self._edges: Dict[int, List[Edge]] = {}
+        self._built: Set[int] = set()
+
+    def distance(self, start: MazeLocation, goal: MazeLocation,
+                 stats: Optional[SearchStats] = None) -> Optional[int]:
+        """ Number of moves from start to goal, None if unreachable """
+        solution: Optional[Node[int]] = self._search(start, goal, stats)
+        return int(solution.cost) if solution is not None else None
+
+    def path(self, start: MazeLocation,
+             goal: MazeLocation) -> Optional[List[MazeLocation]]:
+        """ A shortest path from start to goal, None if unreachable """
+        solution: Optional[Node[int]] = self._search(start, goal)
+        if solution is None:
+            return None
+        abstract: List[int] = node_to_path(solution)
+        cells: List[int] = abstract[:1]
+        for cell, next_cell in zip(abstract, abstract[1:]):
+            if self._cluster(cell) != self._cluster(next_cell):
+                cells.append(next_cell)  # a single move between clusters
+                continue
+            _, parents, _ = self._local(cell, set())
+            stretch: List[int] = [next_cell]
+            while stretch[-1] != cell:
+                stretch.append(parents[stretch[-1]])
+            cells.extend(reversed(stretch[:-1]))
+        return [self.maze.index_location(cell) for cell in cells]
+
+    def _search(self, start: MazeLocation, goal: MazeLocation,
+                stats: Optional[SearchStats] = None) -> Optional[Node[int]]:
+        """ Shortest path through the abstract graph: the cell of start,
+        the entrances the path goes through, and the cell of goal """
+        if self.maze.version != self._version:
+            self._version = self.maze.version
+            self._edges.clear()
+            self._built.clear()
+        source: int = self.maze.location_index(start)
+        target: int = self.maze.location_index(goal)
+        if source < 0 or target < 0:
+            raise ValueError(f'{start} or {goal} is outside of the board')
+        if source == target:
+            return Node(source, None)
+        if self._grid[source] or self._grid[target]:
+            # the moves worked out for a cell don't look at whether the
+            # cell itself is free, so a blocked end has to be turned away
+            return None
+
+        # start and goal join the abstract graph through their own clusters
+        source_entrances: Set[int] = self._entrances(self._cluster(source))
+        from_source, _, start_edges = self._local(source, source_entrances)
+        start_edges = self._crossings(source) + start_edges
+        if target in from_source:
+            start_edges.append((target, from_source[target]))
+        _, _, to_target = self._local(target,
+                                      self._entrances(self._cluster(target)))
+        goal_edges: Dict[int, int] = dict(to_target)
+
+        def successors(cell: int) -> List[Edge]:
+            if cell == source:
+                return start_edges
+            edges: List[Edge] = self._entrance_edges(cell)
+            if cell in goal_edges:
+                return edges + [(target, goal_edges[cell])]
+            return edges
+
+        target_row, target_column = divmod(target, self.columns)
+
+        def heuristic(cell: int) -> int:
+            row, column = divmod(cell, self.columns)
+            return knight_moves(row - target_row, column - target_column)
+
+        return astar_weighted(source, target.__eq__, successors, heuristic, stats)
+
+    def _cluster(self, cell: int) -> int:
+        row, column = divmod(cell, self.columns)
+        return (row // self.cluster_size) * self._cluster_columns + \
+            column // self.cluster_size
+
+    def _moves(self, cell: int) -> List[int]:
+        """ The free cells a knight can jump to from cell """
+        rows, columns, grid = self.rows, self.columns, self._grid
+        r0, c0 = divmod(cell, columns)
+        cells: List[int] = []
+        for dr, dc in KNIGHT_MOVES:
+            r = r0 + dr
+            c = c0 + dc
+            if 0 <= r < rows and 0 <= c < columns and not grid[r * columns + c]:
+                cells.append(r * columns + c)
+        return cells
+
+    def _crossings(self, cell: int) -> List[Edge]:
+        """ The moves from cell into other clusters """
+        cluster: int = self._cluster(cell)
+        return [(other, 1) for other in self._moves(cell)
+                if self._cluster(other) != cluster]
+
+    def _is_entrance(self, cell: int) -> bool:
+        return not self._grid[cell] and bool(self._crossings(cell))
+
+    def _cluster_cells(self, cluster: int) -> List[int]:
+        size: int = self.cluster_size
+        first_row: int = cluster // self._cluster_columns * size
+        first_column: int = cluster % self._cluster_columns * size
+        return [row * self.columns + column
+                for row in range(first_row, min(first_row + size, self.rows))
+                for column in range(first_column,
+                                    min(first_column + size, self.columns))]
+
+    def _entrances(self, cluster: int) -> Set[int]:
+        return {cell for cell in self._cluster_cells(cluster)
+                if self._is_entrance(cell)}
+
+    def _local_moves(self, cluster: int) -> Dict[int, List[int]]:
+        """ The moves that stay inside a cluster, from each of its cells """
+        return {cell: [other for other in self._moves(cell)
+                       if self._cluster(other) == cluster]
+                for cell in self._cluster_cells(cluster)}
+
+    def _local(self, source: int, entrances: Set[int],
+               local_moves: Optional[Dict[int, List[int]]] = None
+               ) -> Tuple[Dict[int, int], Dict[int, int], List[Edge]]:
+        """ bfs from source that stays inside its cluster.
+
+        Returns the (moves, parent) of every cell reached, and the edges from
+        source to the entrances that no shortest path reaches through another
+        entrance: the others add nothing to the abstract graph, as the path
+        through that other entrance costs the same.
+        """
+        if local_moves is None:
+            local_moves = self._local_moves(self._cluster(source))
+        distances: Dict[int, int] = {source: 0}
+        parents: Dict[int, int] = {source: source}
+        # cells with an entrance other than source on a shortest path to them
+        behind_entrance: Set[int] = set()
+        edges: List[Edge] = []
+        frontier: Deque[int] = deque([source])
+        while frontier:
+            current: int = frontier.popleft()
+            moves: int = distances[current] + 1
+            passed: bool = current in behind_entrance or \
+                (current != source and current in entrances)
+            for cell in local_moves.get(current, ()):
+                if cell not in distances:
+                    distances[cell] = moves
+                    parents[cell] = current
+                    frontier.append(cell)
+                elif distances[cell] != moves:
+                    continue
+                if passed:
+                    behind_entrance.add(cell)
+            if current != source and current in entrances and \
+                    current not in behind_entrance:
+                edges.append((current, distances[current]))
+        return distances, parents, edges
+
+    def _entrance_edges(self, cell: int) -> List[Edge]:
+        cluster: int = self._cluster(cell)
+        if cluster not in self._built:
+            self._build(cluster)
+        return self._edges[cell]
+
+    def _build(self, cluster: int) -> None:
+        """ Find the entrances of a cluster and the paths between them """
+        local_moves: Dict[int, List[int]] = self._local_moves(cluster)
+        entrances: Set[int] = self._entrances(cluster)
+        for entrance in entrances:
+            _, _, edges = self._local(entrance, entrances, local_moves)
+            self._edges[entrance] = self._crossings(entrance) + edges
+        self._built.add(cluster)
@@ -1,24 +1,495 @@
-from mazes import MazeLocation, Maze
-from generic_search import bfs, dfs, astar, node_to_path
-from typing import Tuple, List
-from maze_graphics import MazeWin
+from mazes import MazeLocation, Maze, MAX_GRID_CELLS, SpatialIndex, \
+    knight_moves, path_region
+from generic_search import bfs, dfs, astar, astar_indexed, anytime_astar, \
+    path_length, Node, SearchStats, SearchBuffers
+from typing import Tuple, List, Optional, Iterable, Iterator, FrozenSet
+from time import perf_counter
+from collections import Counter, OrderedDict
+from array import array
+from wavefront import wavefront
+from bitboard import BitBoard
+from sparse import SparseBoard
 
 
-def attack(start: Tuple, dest: Tuple, obstacles: List[Tuple]):
-    m_start = MazeLocation(row=start[0], column=start[1])
-    m_goal = MazeLocation(row=dest[0], column=dest[1])
-    m_obs = []
-    for o in obstacles:
-        m_obs.append(MazeLocation(row=o[0], column=o[1]))
+class KnightSolver:
+    """ attack() for many queries against the same obstacles.
 
-    m = Maze(start=m_start, goal=m_goal, obstacles=m_obs)
-    distance = m.euclidian_distance()
-    solution = astar(m.start, m.goal_test, m.successors, distance)
-    if solution:
-        path = node_to_path(solution)
-        return len(path) - 1
+    The first query against a board searches it as attack() would on its
+    own. From the second on, the board is compiled once, as queries need it
+    (move adjacency, connected components, search buffers), and shared by
+    every query. If a query falls outside the compiled board, the board is
+    rebuilt large enough for it (see mazes.SEARCH_PAD). Boards too large to
+    compile are searched per query, and queries too far apart for even that
+    go over a sparse waypoint graph instead.
 
-    return None
+    Once a destination has been asked for FIELD_AFTER times, a distance
+    field is built for it with one bfs, and from then on every query to
+    (or, moves being symmetric, from) it is a lookup. The fields are kept
+    in least recently used order within max_field_bytes. The query counts
+    start over when the fields are dropped, or past MAX_COUNTED_GOALS
+    destinations.
+    """
+    FIELD_AFTER = 2
+    MAX_COUNTED_GOALS = 4096
+    # ways to search the compiled board: the indexed astar, and for big open
+    # boards the numpy wavefront or the big int bitboard
+    ENGINES = ('astar', 'wavefront', 'bitboard')
+
+    def __init__(self, obstacles: Iterable[Tuple],
+                 max_field_bytes: int = 16 * 2 ** 20) -> None:
+        self.obstacles: List[MazeLocation] = \
+            [MazeLocation(row=o[0], column=o[1]) for o in obstacles]
+        # for finding the obstacles near a query without going through all
+        self._obstacle_index: SpatialIndex = SpatialIndex(self.obstacles)
+        self.maze: Optional[Maze] = None
+        self.max_field_bytes: int = max_field_bytes
+        self._compilable: bool = False
+        self._buffers: Optional[SearchBuffers] = None
+        self._bitboard: Optional[BitBoard] = None
+        self._sparse: Optional[SparseBoard] = None
+        self._maze_version: int = 0
+        self._fields: OrderedDict = OrderedDict()  # location -> distances
+        self._field_bytes: int = 0
+        self._queries_per_goal: Counter = Counter()
+        self._board_queries: int = 0  # queries against the current board
+        self.exact: bool = True  # see attack_many()
+
+    @property
+    def cells(self) -> int:
+        """ Number of cells in the board's obstacle grid, 0 if it has none """
+        return self.maze.size if self.maze is not None and self._compilable \
+            else 0
+
+    def add_obstacle(self, location: Tuple) -> None:
+        location = MazeLocation(row=location[0], column=location[1])
+        if location not in self.obstacles:
+            self.obstacles.append(location)
+        self._obstacle_index.add(location)
+        self._sparse = None
+        if self.maze is not None:
+            self.maze.add_obstacle(location)
+
+    def remove_obstacle(self, location: Tuple) -> None:
+        location = MazeLocation(row=location[0], column=location[1])
+        if location in self.obstacles:
+            self.obstacles.remove(location)
+        self._obstacle_index.remove(location)
+        self._sparse = None
+        if self.maze is not None:
+            self.maze.remove_obstacle(location)
+
+    def attack(self, start: Tuple, dest: Tuple,
+               stats: Optional[SearchStats] = None, engine: str = 'astar',
+               epsilon: float = 1.0,
+               deadline: Optional[float] = None) -> Optional[int]:
+        return self.attack_many([(start, dest)], stats, engine, epsilon,
+                                deadline)[0]
+
+    def attack_many(self, queries: Iterable[Tuple[Tuple, Tuple]],
+                    stats: Optional[SearchStats] = None, engine: str = 'astar',
+                    epsilon: float = 1.0,
+                    deadline: Optional[float] = None) -> List[Optional[int]]:
+        """ Number of moves for every (start, dest) pair, None where dest
+        can't be reached. stats, if given, totals all of the searches.
+
+        With epsilon > 1 the astar engine may answer with up to epsilon
+        times the fewest moves, which it finds faster. Given a deadline (a
+        time.perf_counter() time) it keeps improving the answers until
+        then, or until they're the fewest moves.
+
+        Afterwards, exact tells whether every answer is known to be the
+        fewest moves: not so for an epsilon > 1 search that didn't get down
+        to them, nor for the sparse waypoint search of queries too far apart
+        to search cell by cell.
+        """
+        if engine not in KnightSolver.ENGINES:
+            raise ValueError(f'Unknown engine {engine!r}, expected one of '
+                             f'{KnightSolver.ENGINES}')
+        started: float = perf_counter()
+        pairs: List[Tuple[MazeLocation, MazeLocation]] = \
+            [(MazeLocation(row=s[0], column=s[1]), MazeLocation(row=d[0], column=d[1]))
+             for s, d in queries]
+        if not pairs:
+            return []
+        maze: Maze = self._board([l for pair in pairs for l in pair])
+        if len(self._queries_per_goal) > KnightSolver.MAX_COUNTED_GOALS:
+            self._queries_per_goal.clear()
+        self._queries_per_goal.update(goal for _, goal in pairs)
+        self._board_queries += len(pairs)
+        _add_time(stats, 'setup', perf_counter() - started)
+
+        self.exact = True
+        return [self._attack(maze, start, goal, stats, engine, epsilon, deadline)
+                for start, goal in pairs]
+
+    def _attack(self, maze: Maze, start: MazeLocation, goal: MazeLocation,
+                stats: Optional[SearchStats], engine: str, epsilon: float,
+                deadline: Optional[float]) -> Optional[int]:
+        if start == goal:
+            return 0
+        compiled: bool = self._compilable and not maze.is_obstacle(start)
+        if compiled:
+            distance: Optional[int] = self._cached(maze, start, goal)
+            if distance is not None:
+                return distance if distance >= 0 else None
+        checked: float = perf_counter()
+        moves: Optional[int] = self._open_field(start, goal)
+        _add_time(stats, 'open field', perf_counter() - checked)
+        if moves is not None:
+            return moves
+        if not compiled:
+            # too large to compile, or starting on an obstacle (which the
+            # compiled board has no moves out of): search this one on its own
+            single: Maze = Maze(start=start, goal=goal, obstacles=self.obstacles)
+            lower, upper = single.search_region(
+                knight_moves(goal.row - start.row, goal.column - start.column))
+            if (upper.row - lower.row + 1) * (upper.column - lower.column + 1) \
+                    <= MAX_GRID_CELLS:
+                return _search(single, stats)
+            # even the closest region is too big to search cell by cell:
+            # go from one cluster of obstacles to the next
+            if self._sparse is None:
+                self._sparse = SparseBoard(self.obstacles)
+            self.exact = False
+            return self._sparse.distance(start, goal, stats)
+
+        distance = self._lookup(maze, start, goal, stats)
+        if distance is not None:
+            return distance if distance >= 0 else None
+
+        if engine == 'wavefront':
+            # the wavefront runs out on its own when the goal can't be
+            # reached, so it needs neither the adjacency nor the components
+            searched: float = perf_counter()
+            moves = wavefront(maze, start, goal)
+            _add_time(stats, 'search', perf_counter() - searched)
+            return moves
+        if engine == 'bitboard':
+            searched = perf_counter()
+            if self._bitboard is None:
+                self._bitboard = BitBoard(maze)
+            moves = self._bitboard.moves(start, goal)
+            _add_time(stats, 'search', perf_counter() - searched)
+            return moves
+        if self._board_queries < 2:
+            # the only query on this board so far: compiling it would cost
+            # far more than searching it, as attack() without a solver does
+            if epsilon == 1:
+                return _search(Maze(start=start, goal=goal,
+                                    obstacles=self.obstacles), stats)
+            if not maze.is_reachable(start, goal):
+                return None
+            return self._anytime(anytime_astar(
+                start, goal.__eq__, maze.successors,
+                lambda l: knight_moves(goal.row - l.row, goal.column - l.column),
+                epsilon, deadline if deadline is not None else 0.0, stats))
+
+        checked = perf_counter()
+        maze.components()  # worth labelling now that the board is reused
+        reachable: bool = maze.is_reachable(start, goal)
+        _add_time(stats, 'reachability', perf_counter() - checked)
+        if not reachable:
+            return None
+
+        goal_index: int = maze.location_index(goal)
+        if epsilon > 1:
+            offsets, neighbors = maze.compile()
+            # without a deadline the first solution will do
+            solutions = anytime_astar(
+                maze.location_index(start), goal_index.__eq__,
+                lambda i: neighbors[offsets[i]:offsets[i + 1]],
+                maze.knight_distance_indexed(goal), epsilon,
+                deadline if deadline is not None else 0.0, stats)
+            return self._anytime(solutions)
+
+        if self._buffers is None:
+            self._buffers = SearchBuffers(maze.size)
+        path = astar_indexed(maze.location_index(start), goal_index,
+                             *maze.compile(), maze.knight_distance_indexed(goal),
+                             self._buffers, stats)
+        if path is None:
+            return None
+        return self._buffers.cost[goal_index]
+
+    def _anytime(self, solutions: Iterator[Tuple[Node, float]]) -> Optional[int]:
+        """ Moves of the last of anytime_astar()'s solutions, each at least
+        as good as the one before """
+        solution: Optional[Node] = None
+        bound: float = 1.0
+        for solution, bound in solutions:
+            pass
+        if solution is None:
+            return None
+        if bound > 1:
+            self.exact = False
+        return path_length(solution)
+
+    def _open_field(self, start: MazeLocation,
+                    goal: MazeLocation) -> Optional[int]:
+        """ knight_moves() from start to goal if no obstacle can be on a
+        shortest path between them, else None.
+
+        An obstacle is only in the way if going through it costs nothing
+        extra, i.e. it lies inside the "ellipse" of cells whose distances
+        to start and goal add up to the distance between them. The board
+        edges are taken never to be, see mazes.SEARCH_PAD.
+        """
+        moves: int = knight_moves(goal.row - start.row, goal.column - start.column)
+        for o in self._obstacle_index.within(*path_region(start, goal, moves)):
+            if knight_moves(o.row - start.row, o.column - start.column) + \
+                    knight_moves(goal.row - o.row, goal.column - o.column) <= moves:
+                return None
+        return moves
+
+    def _cached(self, maze: Maze, start: MazeLocation,
+                goal: MazeLocation) -> Optional[int]:
+        """ Distance from a distance field already built, -1 if
+        unreachable, None if there's none for start or goal """
+        for source, target in ((goal, start), (start, goal)):
+            if source in self._fields:
+                self._fields.move_to_end(source)
+                return self._fields[source][maze.location_index(target)]
+        return None
+
+    def _lookup(self, maze: Maze, start: MazeLocation, goal: MazeLocation,
+                stats: Optional[SearchStats]) -> Optional[int]:
+        """ Distance from a cached (or now worth caching) distance field,
+        -1 if unreachable, None if there's no field for the query """
+        distance: Optional[int] = self._cached(maze, start, goal)
+        if distance is not None:
+            return distance
+        if self._queries_per_goal[goal] < KnightSolver.FIELD_AFTER:
+            return None
+        # 2 byte distances, or 4 from 2 ** 15 cells on (bfs_distances_indexed())
+        size: int = maze.size * (2 if maze.size < 2 ** 15 else 4)
+        if size > self.max_field_bytes:
+            return None  # it would be dropped as soon as it's built
+        built: float = perf_counter()
+        field: array = maze.distance_field(goal)
+        _add_time(stats, 'field', perf_counter() - built)
+        self._fields[goal] = field
+        self._field_bytes += size
+        while self._field_bytes > self.max_field_bytes:
+            _, evicted = self._fields.popitem(last=False)
+            self._field_bytes -= len(evicted) * evicted.itemsize
+        return field[maze.location_index(start)]
+
+    def _board(self, locations: List[MazeLocation]) -> Maze:
+        """ The compiled board, rebuilt if it doesn't cover locations """
+        if self.maze is not None:
+            if self.maze.version != self._maze_version:
+                # the obstacles changed, the maze recompiles itself
+                self._maze_version = self.maze.version
+                self._bitboard = None
+                self._fields.clear()
+                self._queries_per_goal.clear()
+                self._field_bytes = 0
+            lower, upper = self.maze.limits
+            if all(lower.row <= l.row < upper.row and
+                   lower.column <= l.column < upper.column for l in locations):
+                return self.maze
+            # keep covering what the old board did
+            locations = locations + [lower, MazeLocation(upper.row - 1,
+                                                         upper.column - 1)]
+
+        # the corners of the locations stand in for a start and goal, so
+        # the limits cover every location as well as the obstacles
+        lower = MazeLocation(min(l.row for l in locations),
+                             min(l.column for l in locations))
+        upper = MazeLocation(max(l.row for l in locations),
+                             max(l.column for l in locations))
+        self.maze = Maze(start=lower, goal=upper, obstacles=self.obstacles)
+        self._maze_version = self.maze.version
+        self._buffers = None
+        self._bitboard = None
+        self._board_queries = 0
+        # cell numbers change with the board
+        self._fields.clear()
+        self._field_bytes = 0
+        self._queries_per_goal.clear()
+        # the adjacency, components and buffers are built by the first
+        # query that needs them
+        self._compilable = self.maze.size <= MAX_GRID_CELLS
+        return self.maze
+
+
+# solvers for the most recently attacked boards, so that repeated queries
+# against a board reuse its compiled maze and distance fields. A compiled
+# board takes around 20 bytes a cell, so they're kept only while their
+# grids come to at most MAX_SOLVER_CELLS between them
+_solvers: OrderedDict = OrderedDict()  # frozenset of obstacles -> KnightSolver
+MAX_SOLVERS = 4
+MAX_SOLVER_CELLS = 2 ** 20
+
+
+class ResultCache:
+    """ Least recently used cache of attack() results, with hit and miss
+    counts """
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._results: OrderedDict = OrderedDict()
+
+    def __contains__(self, key: Tuple) -> bool:
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return True
+        self.misses += 1
+        return False
+
+    def __getitem__(self, key: Tuple) -> Optional[int]:
+        return self._results[key]
+
+    def __setitem__(self, key: Tuple, moves: Optional[int]) -> None:
+        self._results[key] = moves
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self.hits = self.misses = 0
+
+
+# the 8 symmetries of the board: (swap row and column, row sign, column sign)
+SYMMETRIES: Tuple[Tuple[bool, int, int], ...] = tuple(
+    (swap, row_sign, column_sign) for swap in (False, True)
+    for row_sign in (1, -1) for column_sign in (1, -1))
+
+
+def canonical_key(start: Tuple, dest: Tuple, obstacles: Iterable[Tuple]) -> Tuple:
+    """ The same key for every (start, dest, obstacles) that differ only by
+    a translation and one of the 8 symmetries of the board, all of which
+    knight moves are blind to (as is mazes.SEARCH_PAD, the same all round).
+
+    The obstacles are put in their canonical form first (see
+    _canonical_obstacles(), which remembers it for the boards seen
+    lately), and of the symmetries that give it, the one that makes
+    (start, dest) smallest wins. Only start and dest are moved per call.
+    """
+    canonical, transforms = _canonical_obstacles(
+        frozenset(tuple(o) for o in obstacles))
+    best: Optional[Tuple] = None
+    for swap, row_sign, column_sign, r0, c0 in transforms:
+        moved = [(row_sign * c, column_sign * r) if swap else
+                 (row_sign * r, column_sign * c) for r, c in (start, dest)]
+        if not canonical:  # nothing else to move them against
+            r0 = min(r for r, _ in moved)
+            c0 = min(c for _, c in moved)
+        key = ((moved[0][0] - r0, moved[0][1] - c0),
+               (moved[1][0] - r0, moved[1][1] - c0))
+        if best is None or key < best:
+            best = key
+    return best + (canonical,)
+
+
+# canonical forms of the obstacles of recent attack() calls
+_canonical: OrderedDict = OrderedDict()  # frozenset of obstacles -> form
+
+
+def _canonical_obstacles(obstacles: FrozenSet[Tuple]) -> Tuple[FrozenSet, List[Tuple]]:
+    """ The obstacles under the symmetry that sorts smallest, moved so that
+    the smallest row and column are 0, and every (swap, row_sign,
+    column_sign, row offset, column offset) that gives that form """
+    if obstacles in _canonical:
+        _canonical.move_to_end(obstacles)
+        return _canonical[obstacles]
+    best: Optional[Tuple] = None
+    transforms: List[Tuple] = []
+    for swap, row_sign, column_sign in SYMMETRIES:
+        moved = [(row_sign * c, column_sign * r) if swap else
+                 (row_sign * r, column_sign * c) for r, c in obstacles]
+        r0: int = min((r for r, _ in moved), default=0)
+        c0: int = min((c for _, c in moved), default=0)
+        key = tuple(sorted((r - r0, c - c0) for r, c in moved))
+        if best is None or key < best:
+            best, transforms = key, []
+        if key == best:
+            transforms.append((swap, row_sign, column_sign, r0, c0))
+    form = _canonical[obstacles] = (frozenset(best), transforms)
+    if len(_canonical) > MAX_SOLVERS:
+        _canonical.popitem(last=False)
+    return form
+
+
+# results of recent attack() calls, by canonical_key()
+result_cache = ResultCache()
+
+
+def attack(start: Tuple, dest: Tuple, obstacles: List[Tuple],
+           stats: Optional[SearchStats] = None, engine: str = 'astar',
+           epsilon: float = 1.0, deadline: Optional[float] = None):
+    started: float = perf_counter()
+    key: Tuple = canonical_key(start, dest, obstacles)
+    found: bool = key in result_cache
+    _add_time(stats, 'cache', perf_counter() - started)
+    if found:
+        return result_cache[key]
+
+    solver: KnightSolver = _solver(frozenset(tuple(o) for o in obstacles))
+    moves = solver.attack(start, dest, stats, engine, epsilon, deadline)
+    _trim_solvers()  # the board may have grown
+    if solver.exact:  # cache only the fewest moves
+        result_cache[key] = moves
+    return moves
+
+
+def _solver(obstacles: FrozenSet[Tuple]) -> KnightSolver:
+    if obstacles in _solvers:
+        _solvers.move_to_end(obstacles)
+        return _solvers[obstacles]
+    solver = _solvers[obstacles] = KnightSolver(obstacles)
+    return solver
+
+
+def _trim_solvers() -> None:
+    """ Drop the least recently used solvers until there are at most
+    MAX_SOLVERS, with at most MAX_SOLVER_CELLS of grids between them """
+    for obstacles in [obstacles for obstacles, solver in _solvers.items()
+                      if solver.cells > MAX_SOLVER_CELLS]:
+        del _solvers[obstacles]  # too big to keep at all
+    cells: int = sum(solver.cells for solver in _solvers.values())
+    while len(_solvers) > MAX_SOLVERS or cells > MAX_SOLVER_CELLS:
+        _, evicted = _solvers.popitem(last=False)
+        cells -= evicted.cells
+
+
+def _search(m: Maze, stats: Optional[SearchStats] = None) -> Optional[int]:
+    """ Search a single uncompiled maze from its start to its goal """
+    checked: float = perf_counter()
+    reachable: bool = m.is_reachable()
+    _add_time(stats, 'reachability', perf_counter() - checked)
+    if not reachable:
+        return None
+
+    # search the region holding every path of up to bound moves, which
+    # grows until it holds the path found, or all of the padded limits,
+    # past which there's taken to be no path (see mazes.SEARCH_PAD)
+    distance = m.knight_distance()
+    padded_lower, padded_upper = m.padded_region()
+    bound: int = distance(m.start)
+    while True:
+        m.region = m.search_region(bound)
+        solution = astar(m.start, m.goal_test, m.successors, distance, stats=stats)
+        if solution is not None:
+            if solution.cost <= bound:
+                return path_length(solution)
+            bound = int(solution.cost)  # one more search settles it
+            continue
+        lower, upper = m.region
+        if lower.row <= padded_lower.row and lower.column <= padded_lower.column \
+                and upper.row >= padded_upper.row and upper.column >= padded_upper.column:
+            return None
+        bound *= 2
+
+
+def _add_time(stats: Optional[SearchStats], phase: str, seconds: float) -> None:
+    if stats is not None:
+        stats.phase_times[phase] = stats.phase_times.get(phase, 0.0) + seconds
 
 
 def data_builder(data_string: str):
@@ -32,6 +503,8 @@ def data_builder(data_string: str):
             obstacle_list]
 
 if __name__ == '__main__':
+    from maze_graphics import MazeWin
+
     # display(s_test, g_test, o_test)
 
     data_test = ('''\
@@ -143,9 +616,8 @@ if __name__ == '__main__':
     print(f.limits, f.start, f.goal)
     w = MazeWin(f)
     # s = bfs(f.start, f.goal_test, f.successors, w)
-    dist = f.euclidian_distance()
+    dist = f.knight_distance()
     a = astar(f.start, f.goal_test, f.successors,
                dist, w)
 
-    w.show_path(a)
     w.exit_on_click()
\ No newline at end of file
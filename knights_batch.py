@@ -0,0 +1,119 @@
+""" Solve many knight's attack puzzles in parallel
+
+    python knights_batch.py puzzles.txt [-o results.jsonl] [-j 4] [-c 64]
+
+The input holds ASCII boards (the format Maze reads) separated by empty
+lines or '#' header lines, and/or puzzles in the tuple format of attack(),
+one per line:
+
+    ((7, 1), (3, 3), ((5, 2), (4, 4)))
+
+Every puzzle gets a JSON line {"index": ..., "moves": ...} in input order,
+with null moves where the goal can't be reached. Each worker process is
+given the file name once, when it starts, and tasks only carry the byte
+range of a chunk of puzzles, which the worker reads from the file itself.
+"""
+import argparse
+import json
+import os
+import sys
+from ast import literal_eval
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Iterator, TextIO
+
+from knights import attack, data_builder
+from mazes import read_boards
+
+Puzzle = Tuple[Tuple, Tuple, Tuple]
+
+# the puzzle file of the batch, set in every worker by _init_worker
+_path: str = ''
+
+
+def parse_puzzles(board: str) -> List[Puzzle]:
+    """ The puzzles in one board of a puzzle file: the board itself, or
+    one per line for the tuple format """
+    if not board.lstrip().startswith('('):
+        start, dest, obstacles = data_builder(board)
+        return [(start, dest, tuple(obstacles))]
+
+    puzzles: List[Puzzle] = []
+    for line in board.splitlines():
+        if line.strip():
+            start, dest, obstacles = literal_eval(line.strip())
+            puzzles.append((tuple(start), tuple(dest),
+                            tuple(tuple(o) for o in obstacles)))
+    return puzzles
+
+
+def read_puzzles(path: str, start: int = 0,
+                 end: Optional[int] = None) -> Iterator[Puzzle]:
+    for _, board in read_boards(path, start, end):
+        yield from parse_puzzles(board)
+
+
+def chunk_ranges(path: str, chunk_size: int) -> Iterator[Tuple[int, Optional[int]]]:
+    """ Byte ranges holding chunk_size puzzles each (the last one open);
+    read_boards() gives every puzzle of the tuple format its own offset """
+    first: Optional[int] = None
+    for n, (offset, _) in enumerate(read_boards(path)):
+        if n % chunk_size == 0:
+            if first is not None:
+                yield first, offset
+            first = offset
+    if first is not None:
+        yield first, None
+
+
+def _init_worker(path: str) -> None:
+    global _path
+    _path = path
+
+
+def _solve_chunk(bounds: Tuple[int, Optional[int]]) -> List[Optional[int]]:
+    return [attack(*puzzle) for puzzle in read_puzzles(_path, *bounds)]
+
+
+def solve(path: str, jobs: int = 1,
+          chunk_size: int = 64) -> Iterator[Tuple[int, Optional[int]]]:
+    """ (index, moves) for every puzzle in the file, in order """
+    chunks: Iterator[Tuple[int, Optional[int]]] = chunk_ranges(path, chunk_size)
+    if jobs == 1:
+        _init_worker(path)
+        results = map(_solve_chunk, chunks)
+        yield from enumerate(moves for chunk in results for moves in chunk)
+        return
+
+    with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                             initargs=(path,)) as executor:
+        results = executor.map(_solve_chunk, chunks)
+        yield from enumerate(moves for chunk in results for moves in chunk)
+
+
+def write_results(results: Iterator[Tuple[int, Optional[int]]],
+                  out: TextIO) -> None:
+    for index, moves in results:
+        out.write(json.dumps({'index': index, 'moves': moves}) + '\n')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('puzzles', help='puzzle file')
+    parser.add_argument('-o', '--output', help='results file (default stdout)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes')
+    parser.add_argument('-c', '--chunk-size', type=int, default=64,
+                        help='puzzles per task')
+    args = parser.parse_args(argv)
+
+    results = solve(args.puzzles, args.jobs, args.chunk_size)
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            write_results(results, out)
+    else:
+        write_results(results, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+""" Timings for the search options on the boards from knights_test.py
+
+    python knights_bench.py
+"""
+from timeit import repeat
+from mazes import Maze, MazeLocation
+from knights import KnightSolver, data_builder
+from generic_search import astar, PriorityQueue, BucketQueue, IndexedHeap, \
+    SearchStats
+
+WORST_CASE = ('''\
+***********************************************
+***********************************************
+**  **      **                               **
+**  **      **                               **
+**  **  **  **  ***************************  **
+**  **  **  **  ***************************  **
+**  **  **  **  ***      **      **      **  **
+**      **      ***  **  **      **      **  **
+**   S  **      ***  **  **  **  **  **  **  **
+*******************  **  **  **  **  **  **  **
+*******************  **  **  **  **  **  **  **
+*******************  **  **  **  **  **  **  **
+**               **  **  **  **  **  **  **  **
+**           E   **  **  **  **  **  **  **  **
+**               **  **  **  **  **  **  **  **
+**************** **  **  **  **  **  **  **  **
+**************** **  **  **  **  **  **  **  **
+**               **  **  **  **  **  **  **  **
+**               **  **  **  **  **  **  **  **
+**               **  **  **  **  **  **  **  **
+** ****************  **  **  **  **  **  **  **
+** ****************  **  **  **  **  **  **  **
+**                   **      **      **  **  **
+**                   **      **      **  **  **
+**                   **      **      **      **
+***********************************************
+***********************************************''')  # 105 moves
+
+
+def bench(name: str, func, number: int = 20) -> None:
+    best: float = min(repeat(func, number=number, repeat=5)) / number
+    print(f'{name:<32}{best * 1000:8.2f} ms')
+
+
+def bench_queues(maze: Maze) -> None:
+    distance = maze.knight_distance()
+    for name, queue in (('binary heap', PriorityQueue),
+                        ('bucket queue', BucketQueue),
+                        ('indexed 4-ary heap', IndexedHeap)):
+        bench(f'astar, {name}',
+              lambda: astar(maze.start, maze.goal_test, maze.successors,
+                            distance, queue=queue))
+        stats = SearchStats()
+        astar(maze.start, maze.goal_test, maze.successors, distance,
+              queue=queue, stats=stats)
+        print(f'    {stats}')
+
+
+def bench_repeated_queries(board: str) -> None:
+    start, dest, obstacles = data_builder(board)
+    maze = Maze(board)
+    free = [(r, c) for r in range(maze.upper_limit.row)
+            for c in range(maze.upper_limit.column)
+            if not maze.is_obstacle(MazeLocation(r, c))]
+    queries = [(s, dest) for s in free[::7]]
+    bench(f'{len(queries)} queries, one solver each',
+          lambda: [KnightSolver(obstacles).attack(s, d) for s, d in queries], 1)
+    bench(f'{len(queries)} queries, attack_many',
+          lambda: KnightSolver(obstacles).attack_many(queries), 1)
+
+
+def bench_engines(size: int = 200) -> None:
+    """ One query across a size x size board with each engine, around a
+    wall (without obstacles in the way, there's nothing to search) """
+    wall = [(size // 2, c) for c in range(size // 10, size - size // 10)]
+    for engine in KnightSolver.ENGINES:
+        try:
+            bench(f'{size}x{size} board, {engine}',
+                  lambda: KnightSolver(wall).attack(
+                      (0, size // 2), (size - 1, size // 2 + 1), engine=engine), 1)
+        except ImportError as e:
+            print(f'{size}x{size} board, {engine}: {e}')
+
+
+if __name__ == '__main__':
+    bench_queues(Maze(WORST_CASE))
+    bench_repeated_queries(WORST_CASE)
+    bench_engines()
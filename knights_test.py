@@ -1,12 +1,28 @@
 # hello?
 
 import unittest
-from knights import attack, data_builder
+from knights import attack, data_builder, KnightSolver, canonical_key, \
+    ResultCache
+import knights
+import wavefront
+import bitboard
+import hierarchical
+import sparse
+from knights_batch import read_puzzles, solve
+import knights_batch
+import os
+import tempfile
+from time import perf_counter
+from mazes import Maze, MazeLocation, knight_moves, read_boards, read_mazes
+import mazes
+from generic_search import bfs, dfs, bfs_indexed, astar, astar_indexed, \
+    node_to_path, bidirectional_bfs, path_length, SearchBuffers, SearchStats, \
+    PriorityQueue, BucketQueue, IndexedHeap, HookChain, LoggingHooks, \
+    ProfilingHooks, LifelongAStar, ida_star, anytime_astar, astar_weighted
 
 # changing something here!
 class KnightTest(unittest.TestCase):
-    def test_basic(self):
-        data_test = ('''\
+    basic = ('''\
         *************************
         *   *                   *
         *   *                   *
@@ -16,10 +32,8 @@ class KnightTest(unittest.TestCase):
         *       *     *E*       *
         *       *     * *       *
         *************************''')  # 8 moves
-        self.assertEqual(attack(*data_builder(data_test)), 8)
 
-    def test_worst_case(self):
-        worst_case = ('''\
+    worst_case = ('''\
         ***********************************************
         ***********************************************
         **  **      **                               **
@@ -47,10 +61,8 @@ class KnightTest(unittest.TestCase):
         **                   **      **      **      **
         ***********************************************
         ***********************************************''')  # 105 moves
-        self.assertEqual(attack(*data_builder(worst_case)), 105)
 
-    def test_too_slow(self):
-        too_slow = ('''\
+    too_slow = ('''\
                                                                               
                                                                       
                                                                       
@@ -81,7 +93,680 @@ class KnightTest(unittest.TestCase):
                                                                       
                                                                       
                                                                       ''')
-        self.assertEqual(attack(*data_builder(too_slow)), 24)
+
+    walled_in = ('''\
+        ***************************************************************
+        ***************************************************************
+        **  S                                                        **
+        **                                                     E     **
+        ***************************************************************
+        ***************************************************************''')
+
+    def test_basic(self):
+        self.assertEqual(attack(*data_builder(self.basic)), 8)
+
+    def test_worst_case(self):
+        self.assertEqual(attack(*data_builder(self.worst_case)), 105)
+
+    def test_too_slow(self):
+        self.assertEqual(attack(*data_builder(self.too_slow)), 24)
+
+    def test_unreachable(self):
+        self.assertIsNone(attack(*data_builder(self.walled_in)))
+        m = Maze(self.walled_in)
+        self.assertFalse(m.is_reachable())
+        self.assertIsNone(m._components)  # settled by the flood alone
+        m.components()
+        self.assertFalse(m.is_reachable())
+        sealed_goal = ((5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5), (8, 9), (9, 8))
+        self.assertIsNone(attack((0, 0), (7, 7), sealed_goal))
+
+
+class CompiledMazeTest(unittest.TestCase):
+    board = ('''\
+    *********
+    *S *    *
+    *  * ** *
+    *    *E *
+    *********''')
+
+    def test_indexed_search(self):
+        m = Maze(self.board)
+        offsets, neighbors = m.compile()
+        start = m.location_index(m.start)
+        goal = m.location_index(m.goal)
+        path = bfs_indexed(start, goal, offsets, neighbors)
+        self.assertEqual(m.index_location(path[0]), m.start)
+        self.assertEqual(m.index_location(path[-1]), m.goal)
+        self.assertEqual(len(path) - 1, attack(*data_builder(self.board)))
+        self.assertEqual(len(astar_indexed(start, goal, offsets, neighbors,
+                                           lambda i: 0)), len(path))
+
+    def test_reused_buffers(self):
+        m = Maze(self.board)
+        offsets, neighbors = m.compile()
+        start = m.location_index(m.start)
+        goal = m.location_index(m.goal)
+        buffers = SearchBuffers(m.size)
+        distance = m.knight_distance_indexed()
+        for _ in range(3):
+            there = astar_indexed(start, goal, offsets, neighbors, distance,
+                                  buffers)
+            self.assertEqual(buffers.cost[goal], len(there) - 1)
+            back = bfs_indexed(goal, start, offsets, neighbors, buffers)
+            self.assertEqual(buffers.cost[start], len(there) - 1)
+            self.assertEqual(len(back), len(there))
+
+    def test_obstacles_have_no_neighbors(self):
+        m = Maze(self.board)
+        offsets, neighbors = m.compile()
+        for o in m.obstacles:
+            i = m.location_index(o)
+            self.assertEqual(offsets[i], offsets[i + 1])
+            self.assertNotIn(i, neighbors)
+
+    def test_bidirectional_bfs(self):
+        m = Maze(self.board)
+        path = node_to_path(bidirectional_bfs(m.start, m.goal, m.successors))
+        self.assertEqual(path[0], m.start)
+        self.assertEqual(path[-1], m.goal)
+        self.assertEqual(len(path) - 1, attack(*data_builder(self.board)))
+        for a, b in zip(path, path[1:]):
+            self.assertIn(b, m.successors(a))
+        # a blocked goal has moves out of it, but none into it
+        m = Maze(start=MazeLocation(0, 0), goal=MazeLocation(2, 1),
+                 obstacles=[MazeLocation(2, 1)])
+        self.assertIsNone(bfs(m.start, m.goal_test, m.successors))
+        self.assertIsNone(bidirectional_bfs(m.start, m.goal, m.successors))
+
+    def test_bucket_queue(self):
+        m = Maze(self.board)
+        distance = m.knight_distance()
+        heap = astar(m.start, m.goal_test, m.successors, distance)
+        buckets = astar(m.start, m.goal_test, m.successors, distance,
+                        queue=BucketQueue)
+        self.assertEqual(buckets.cost, heap.cost)
+        self.assertEqual(path_length(buckets), heap.cost)
+        self.assertEqual(node_to_path(buckets)[-1], m.goal)
+
+    def test_stats(self):
+        stats = SearchStats()
+        start, dest, obstacles = data_builder(self.board)
+        self.assertEqual(KnightSolver(obstacles).attack(start, dest, stats), 3)
+        self.assertGreater(stats.expansions, 0)
+        self.assertEqual(stats.heuristic_evaluations, stats.pushes)
+        self.assertGreaterEqual(stats.peak_explored, stats.peak_frontier)
+        self.assertEqual(set(stats.phase_times),
+                         {'setup', 'open field', 'reachability', 'search'})
+        m = Maze(self.board)
+        for search in (bfs, dfs):
+            stats = SearchStats()
+            search(m.start, m.goal_test, m.successors, stats=stats)
+            self.assertEqual(stats.peak_explored, stats.pushes)
+
+    def test_no_re_expansions(self):
+        m = Maze(self.board)
+        distance = m.knight_distance()
+        for queue, h in ((PriorityQueue, distance), (PriorityQueue, lambda l: 0),
+                         (IndexedHeap, distance), (BucketQueue, distance)):
+            stats = SearchStats()
+            solution = astar(m.start, m.goal_test, m.successors, h,
+                             queue=queue, stats=stats)
+            self.assertEqual(solution.cost, attack(*data_builder(self.board)))
+            self.assertEqual(stats.re_expansions, 0)
+            self.assertGreater(stats.expansions, 0)
+            if queue is IndexedHeap:
+                self.assertEqual(stats.stale_skipped, 0)
+
+    def test_ida_star(self):
+        m = Maze(self.board)
+        distance = m.knight_distance()
+        moves = attack(*data_builder(self.board))
+        for table_size in (0, 16, 1 << 16):
+            stats = SearchStats()
+            solution = ida_star(m.start, m.goal_test, m.successors, distance,
+                                table_size, stats)
+            self.assertEqual(len(node_to_path(solution)) - 1, moves)
+            self.assertLessEqual(stats.peak_explored, table_size)
+            self.assertLessEqual(stats.peak_frontier, moves + 1)
+
+        walled_in = Maze(KnightTest.walled_in)
+        self.assertIsNone(ida_star(walled_in.start, walled_in.goal_test,
+                                   walled_in.successors,
+                                   walled_in.knight_distance(), 1 << 12))
+
+    def test_anytime_astar(self):
+        m = Maze(KnightTest.worst_case)
+        solutions = list(anytime_astar(m.start, m.goal_test, m.successors,
+                                       m.knight_distance(), weight=5.0))
+        lengths = [path_length(solution) for solution, _ in solutions]
+        self.assertEqual(lengths, sorted(lengths, reverse=True))
+        for length, (_, bound) in zip(lengths, solutions):
+            self.assertLessEqual(length, bound * 105)
+        self.assertEqual(lengths[-1], 105)
+        self.assertEqual(solutions[-1][1], 1.0)
+        # past the deadline, the first solution is the last
+        self.assertEqual(len(list(anytime_astar(
+            m.start, m.goal_test, m.successors, m.knight_distance(),
+            weight=5.0, deadline=0.0))), 1)
+
+        walled_in = Maze(KnightTest.walled_in)
+        self.assertEqual(list(anytime_astar(
+            walled_in.start, walled_in.goal_test, walled_in.successors,
+            walled_in.knight_distance())), [])
+
+    def test_hooks(self):
+        m = Maze(self.board)
+        for search in (dfs, bfs, lambda *args, **kwargs: astar(
+                *args[:3], m.knight_distance(), **kwargs)):
+            stats = SearchStats()
+            profiler = ProfilingHooks()
+            with self.assertLogs('generic_search', 'DEBUG'):
+                search(m.start, m.goal_test, m.successors, stats=stats,
+                       hooks=HookChain(profiler, LoggingHooks()))
+            self.assertEqual(profiler.counts['push'], stats.pushes)
+            self.assertEqual(profiler.counts['expand'], stats.expansions)
+            self.assertEqual(profiler.counts['goal'], 1)
+
+        profiler = ProfilingHooks()
+        sealed = Maze(start=MazeLocation(0, 0), goal=MazeLocation(7, 7),
+                      obstacles=[MazeLocation(r, c) for r, c in (
+                          (5, 6), (5, 8), (6, 5), (6, 9),
+                          (9, 6), (8, 5), (8, 9), (9, 8))])
+        self.assertIsNone(bfs(sealed.start, sealed.goal_test,
+                              sealed.successors, hooks=profiler))
+        self.assertEqual(profiler.counts['exhausted'], 1)
+
+
+class ReplanningTest(unittest.TestCase):
+    board = ('''\
+    S
+          *
+          *
+          *        E
+          *
+          *''')
+
+    def test_lifelong_astar(self):
+        m = Maze(self.board)
+        planner = LifelongAStar(m.start, m.goal, m.successors, m.knight_distance(),
+                                lambda l: not m.is_obstacle(l))
+        first = SearchStats()
+        length = path_length(planner.plan(first))
+        self.assertEqual(length, attack(*data_builder(self.board)))
+
+        path = node_to_path(planner.plan())
+        blocked = path[len(path) // 2]
+        m.add_obstacle(blocked)
+        planner.update([blocked])
+        again = SearchStats()
+        replanned = planner.plan(again)
+        self.assertNotIn(blocked, node_to_path(replanned))
+        fresh = astar(m.start, m.goal_test, m.successors, m.knight_distance())
+        self.assertEqual(path_length(replanned), path_length(fresh))
+        self.assertLess(again.expansions, first.expansions)
+
+        m.remove_obstacle(blocked)
+        planner.update([blocked])
+        self.assertEqual(path_length(planner.plan()), length)
+
+    def test_solver_sees_changes(self):
+        solver = KnightSolver([])
+        self.assertEqual(solver.attack((0, 0), (1, 2)), 1)
+        self.assertEqual(solver.attack((0, 0), (1, 2)), 1)  # from a field now
+        solver.add_obstacle((1, 2))
+        self.assertIsNone(solver.attack((0, 0), (1, 2)))
+        solver.remove_obstacle((1, 2))
+        self.assertEqual(solver.attack((0, 0), (1, 2)), 1)
+
+
+class KnightSolverTest(unittest.TestCase):
+    obstacles = ((5, 1), (5, 2), (5, 0), (4, 2), (4, 4), (7, 5), (4, 3), (7, 4),
+                 (3, 4), (3, 6), (4, 7), (6, 7), (6, 4), (3, 6), (4, 5))
+
+    def test_attack_many(self):
+        solver = KnightSolver(self.obstacles)
+        queries = [((7, 1), (3, 3)), ((3, 3), (7, 1)), ((7, 1), (7, 1)),
+                   ((0, 0), (7, 7)), ((7, 6), (2, 1))]
+        expected = [attack(s, d, self.obstacles) for s, d in queries]
+        self.assertEqual(solver.attack_many(queries), expected)
+        self.assertEqual(expected[:3], [4, 4, 0])
+
+    def test_epsilon(self):
+        start, dest, obstacles = data_builder(KnightTest.worst_case)
+        solver = KnightSolver(obstacles)
+        moves = solver.attack(start, dest, epsilon=3.0)
+        self.assertGreaterEqual(moves, 105)
+        self.assertLessEqual(moves, 3 * 105)
+        self.assertFalse(solver.exact)
+        self.assertEqual(solver.attack(start, dest, epsilon=3.0,
+                                       deadline=perf_counter() + 60), 105)
+        self.assertTrue(solver.exact)  # got all the way down to the fewest
+        solver.attack(start, dest, epsilon=3.0, engine='bitboard')
+        self.assertTrue(solver.exact)
+        sealed = ((5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5), (8, 9), (9, 8))
+        self.assertIsNone(KnightSolver(sealed).attack((0, 0), (7, 7),
+                                                      epsilon=3.0))
+
+        knights.result_cache.clear()
+        knights._solvers.clear()  # so that no distance field answers it
+        attack(start, dest, obstacles, epsilon=3.0)
+        self.assertEqual(len(knights.result_cache), 0)
+
+    def test_compiles_on_reuse(self):
+        start, dest, obstacles = data_builder(KnightTest.worst_case)
+        solver = KnightSolver(obstacles)
+        self.assertEqual(solver.attack(start, dest), 105)
+        self.assertIsNone(solver.maze._adjacency)
+        self.assertEqual(solver.attack(dest, start), 105)
+        self.assertIsNotNone(solver.maze._adjacency)
+        self.assertIsNotNone(solver.maze._components)
+
+    def test_board_grows(self):
+        solver = KnightSolver(self.obstacles)
+        self.assertEqual(solver.attack((7, 1), (3, 3)), 4)
+        board = solver.maze
+        self.assertEqual(solver.attack((3, 3), (7, 1)), 4)
+        self.assertIs(solver.maze, board)
+        far = ((-20, 30), (3, 3))
+        self.assertEqual(solver.attack(*far), attack(*far, self.obstacles))
+        self.assertIsNot(solver.maze, board)
+        self.assertEqual(solver.attack((7, 1), (3, 3)), 4)
+
+    def test_distance_fields(self):
+        solver = KnightSolver(self.obstacles)
+        goal = (3, 3)
+        starts = [(7, 1), (0, 0), (7, 6), (2, 9), (3, 3)]
+        expected = [attack(s, goal, self.obstacles) for s in starts]
+        stats = SearchStats()
+        self.assertEqual(solver.attack_many([(s, goal) for s in starts], stats),
+                         expected)
+        # one field, and no searches at all
+        self.assertIn('field', stats.phase_times)
+        self.assertEqual(stats.expansions, 0)
+        stats = SearchStats()
+        self.assertEqual(solver.attack(goal, (7, 1), stats), 4)
+        self.assertNotIn('field', stats.phase_times)
+
+    def test_open_field(self):
+        stats = SearchStats()
+        far_away = ((40, 40), (-30, 25))
+        self.assertEqual(KnightSolver(far_away).attack((7, 1), (0, 9), stats),
+                         knight_moves(-7, 8))
+        self.assertEqual(stats.expansions, 0)
+        # (5, 2) is on every shortest path, so this one needs a search
+        self.assertEqual(KnightSolver(((5, 2),)).attack((7, 1), (3, 3), stats), 4)
+        self.assertGreater(stats.expansions, 0)
+
+    def test_field_cache_is_bounded(self):
+        solver = KnightSolver(self.obstacles, max_field_bytes=1)
+        stats = SearchStats()
+        for _ in range(3):
+            self.assertEqual(solver.attack((7, 1), (3, 3), stats), 4)
+        self.assertEqual(len(solver._fields), 0)
+        self.assertNotIn('field', stats.phase_times)  # not even built
+        # and so are the query counts that decide when to build one
+        limit = KnightSolver.MAX_COUNTED_GOALS
+        KnightSolver.MAX_COUNTED_GOALS = 4
+        try:
+            for row in range(8):
+                solver.attack((0, 0), (row, 9))
+                self.assertLessEqual(len(solver._queries_per_goal), 5)
+        finally:
+            KnightSolver.MAX_COUNTED_GOALS = limit
+        solver.add_obstacle((0, 9))
+        solver.attack((7, 1), (3, 3))
+        self.assertEqual(solver._queries_per_goal[MazeLocation(3, 3)], 1)
+
+
+class ResultCacheTest(unittest.TestCase):
+    start, dest = (7, 1), (3, 3)
+    obstacles = ((5, 1), (5, 2), (5, 0), (4, 2), (4, 4), (7, 5))
+
+    def variants(self):
+        for swap, rs, cs in ((False, 1, 1), (True, 1, 1), (False, -1, 1),
+                             (True, -1, -1), (False, -1, -1)):
+            def move(p, dr=100 * rs, dc=-37):
+                r, c = (p[1], p[0]) if swap else p
+                return rs * r + dr, cs * c + dc
+            yield move(self.start), move(self.dest), [move(o) for o in self.obstacles]
+
+    def test_canonical_key(self):
+        key = canonical_key(self.start, self.dest, self.obstacles)
+        for variant in self.variants():
+            self.assertEqual(canonical_key(*variant), key)
+        self.assertNotEqual(canonical_key(self.start, self.dest, self.obstacles[1:]),
+                            key)
+
+    def test_hits(self):
+        knights.result_cache.clear()
+        self.assertEqual(attack(self.start, self.dest, self.obstacles), 4)
+        self.assertEqual(knights.result_cache.misses, 1)
+        for variant in self.variants():
+            self.assertEqual(attack(*variant), 4)
+        self.assertEqual(knights.result_cache.hits, 5)
+        self.assertEqual(knights.result_cache.misses, 1)
+
+    def test_solvers_are_bounded(self):
+        knights.result_cache.clear()
+        knights._solvers.clear()
+        self.assertEqual(attack(self.start, self.dest, self.obstacles), 4)
+        self.assertEqual(len(knights._solvers), 1)
+        wide = self.obstacles + ((1200, 1200),)
+        self.assertEqual(attack(self.start, self.dest, wide), 4)
+        self.assertEqual(len(knights._solvers), 1)  # too big a board to keep
+        self.assertNotIn(frozenset(wide), knights._solvers)
+
+    def test_eviction(self):
+        cache = ResultCache(maxsize=2)
+        cache['a'], cache['b'] = 1, None
+        self.assertIn('a', cache)
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 2)
+
+
+class BatchTest(unittest.TestCase):
+    puzzles = ('''\
+((7, 1), (5, 2), ())
+((0, 0), (7, 7), ((5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5), (8, 9), (9, 8)))
+
+*********
+*S *    *
+*  * ** *
+*    *E *
+*********
+
+((7, 6), (7, 7), ())
+''')
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('# a header\n' + self.puzzles)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_read_puzzles(self):
+        puzzles = list(read_puzzles(self.path))
+        self.assertEqual(len(puzzles), 4)
+        self.assertEqual(puzzles[0], ((7, 1), (5, 2), ()))
+        self.assertEqual(puzzles[2][:2], ((1, 1), (3, 6)))
+
+    def test_read_mazes(self):
+        with open(self.path, 'w') as f:
+            f.write('\n'.join([CompiledMazeTest.board, '# another',
+                               CompiledMazeTest.board]))
+        read = list(read_mazes(self.path))
+        self.assertEqual(len(read), 2)
+        self.assertEqual(read[1].goal, MazeLocation(3, 10))
+
+    def test_read_boards_mmap(self):
+        boards = list(read_boards(self.path))
+        threshold = mazes.MMAP_THRESHOLD
+        mazes.MMAP_THRESHOLD = 0
+        try:
+            self.assertEqual(list(read_boards(self.path)), boards)
+            # a range yields just the boards starting inside it
+            start, end = boards[1][0], boards[2][0]
+            self.assertEqual(list(read_boards(self.path, start, end)),
+                             boards[1:2])
+        finally:
+            mazes.MMAP_THRESHOLD = threshold
+
+    def test_solve(self):
+        expected = [(0, 1), (1, None), (2, 3), (3, 3)]
+        for chunk_size in (1, 2, 3):
+            self.assertEqual(list(solve(self.path, 1, chunk_size)), expected)
+        self.assertEqual(list(solve(self.path, 2, 1)), expected)
+
+    def test_chunks_split_tuple_lines(self):
+        with open(self.path, 'w') as f:
+            f.write('((7, 1), (5, 2), ())\n' * 10)
+        chunks = list(knights_batch.chunk_ranges(self.path, 4))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(list(solve(self.path, 1, 4)),
+                         [(n, 1) for n in range(10)])
+
+
+@unittest.skipIf(wavefront.np is None, 'the wavefront engine needs numpy')
+class WavefrontTest(unittest.TestCase):
+    def test_matches_astar(self):
+        for board in (CompiledMazeTest.board, ReplanningTest.board):
+            start, dest, obstacles = data_builder(board)
+            self.assertEqual(KnightSolver(obstacles).attack(start, dest,
+                                                            engine='wavefront'),
+                             KnightSolver(obstacles).attack(start, dest))
+        sealed = ((5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5), (8, 9), (9, 8))
+        self.assertIsNone(KnightSolver(sealed).attack((0, 0), (7, 7),
+                                                      engine='wavefront'))
+
+    def test_layers(self):
+        m = Maze(CompiledMazeTest.board)
+        moves, layer_map = wavefront.wavefront(m, layers=True)
+        self.assertIsNone(moves)  # no goal given, everything gets mapped
+        distances = m.distance_field(m.start)
+        self.assertEqual(layer_map.ravel().tolist(), distances.tolist())
+
+
+class BitboardTest(unittest.TestCase):
+    # the puzzles of knights_tests.py that aren't boards here already
+    kata = [((7, 1), (5, 2), ()), ((7, 1), (3, 3), ()), ((7, 6), (0, 5), ()),
+            ((7, 6), (2, 1), ()), ((7, 6), (7, 6), ()), ((7, 6), (7, 7), ()),
+            ((7, 7), (1, 0), ()),
+            ((7, 1), (3, 3), ((5, 1), (5, 2), (5, 0), (4, 2), (4, 4), (7, 5))),
+            ((6, 7), (7, 7), ((5, 5), (5, 6), (5, 7), (8, 6), (6, 9), (9, 6),
+                              (7, 9), (4, 6))),
+            ((7, 1), (3, 3), ((5, 2),)),
+            ((7, 1), (3, 3), ((5, 1), (5, 2), (5, 0), (4, 2), (4, 4), (7, 5),
+                              (4, 3), (7, 4), (3, 4), (3, 6), (4, 7), (6, 7),
+                              (6, 4), (3, 6), (4, 5))),
+            ((7, 6), (7, 7), ((5, 5), (5, 6), (5, 7))),
+            ((7, 1), (3, 3), ((5, 0), (6, 3), (5, 2), (4, 2), (4, 4), (7, 5),
+                              (4, 3), (1, 3), (3, 4), (0, 3), (4, 7), (0, 5),
+                              (6, 4), (1, 7), (4, 5), (4, 6), (5, 3), (7, 3))),
+            ((0, 0), (7, 7), ((5, 5), (5, 6), (5, 7), (5, 8), (6, 5), (8, 6),
+                              (6, 9), (9, 6), (8, 5), (7, 9), (4, 6), (9, 8))),
+            ((0, 0), (7, 7), ((5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5),
+                              (8, 9), (9, 8)))]
+    gap = ('''\
+        ***************************************************************
+        ******************************* *******************************
+        **  S                                                        **
+        **                                                     E     **
+        ***************************************************************
+        ***************************************************************''')
+
+    def test_matches_astar(self):
+        boards = (KnightTest.basic, KnightTest.worst_case, KnightTest.too_slow,
+                  KnightTest.walled_in, CompiledMazeTest.board,
+                  ReplanningTest.board, self.gap)
+        puzzles = [data_builder(board) for board in boards] + self.kata
+        for start, dest, obstacles in puzzles:
+            self.assertEqual(KnightSolver(obstacles).attack(start, dest,
+                                                            engine='bitboard'),
+                             KnightSolver(obstacles).attack(start, dest))
+
+    def test_every_cell(self):
+        m = Maze(CompiledMazeTest.board)
+        board = bitboard.BitBoard(m)
+        distances = m.distance_field(m.start)
+        for index, distance in enumerate(distances):
+            self.assertEqual(board.moves(m.start, m.index_location(index)),
+                             distance if distance >= 0 else None)
+
+    def test_sees_changes(self):
+        solver = KnightSolver(())
+        self.assertEqual(solver.attack((7, 1), (3, 3), engine='bitboard'), 2)
+        solver.add_obstacle((5, 2))
+        self.assertEqual(solver.attack((7, 1), (3, 3), engine='bitboard'), 4)
+
+
+class HierarchicalTest(unittest.TestCase):
+    def test_matches_astar(self):
+        for board in (KnightTest.basic, KnightTest.worst_case,
+                      KnightTest.walled_in, CompiledMazeTest.board,
+                      ReplanningTest.board):
+            m = Maze(board)
+            start, dest, obstacles = data_builder(board)
+            moves = KnightSolver(obstacles).attack(start, dest)
+            for cluster_size in (4, 7, 16):
+                hierarchy = hierarchical.HierarchicalMaze(m, cluster_size)
+                self.assertEqual(hierarchy.distance(m.start, m.goal), moves)
+                path = hierarchy.path(m.start, m.goal)
+                if moves is None:
+                    self.assertIsNone(path)
+                    continue
+                self.assertEqual(len(path) - 1, moves)
+                self.assertEqual((path[0], path[-1]), (m.start, m.goal))
+                for location, next_location in zip(path, path[1:]):
+                    self.assertIn(next_location, m.successors(location))
+
+    def test_sees_changes(self):
+        m = Maze(KnightTest.worst_case)
+        hierarchy = hierarchical.HierarchicalMaze(m)
+        self.assertEqual(hierarchy.distance(m.start, m.goal), 105)
+        self.assertEqual(hierarchy.distance(m.goal, m.start), 105)
+        # all but one of the cells a knight can reach (7, 7) from
+        m = Maze(start=MazeLocation(0, 0), goal=MazeLocation(7, 7),
+                 obstacles=[MazeLocation(*o) for o in ((5, 6), (5, 8), (6, 5),
+                                                       (6, 9), (9, 6), (8, 5),
+                                                       (8, 9))])
+        hierarchy = hierarchical.HierarchicalMaze(m)
+        self.assertIsNotNone(hierarchy.distance(m.start, m.goal))
+        m.add_obstacle(MazeLocation(9, 8))
+        self.assertIsNone(hierarchy.distance(m.start, m.goal))
+
+    def test_not_an_engine(self):
+        with self.assertRaises(ValueError):
+            KnightSolver(()).attack((0, 0), (3, 3), engine='hierarchical')
+
+    def test_blocked_end(self):
+        m = Maze(start=MazeLocation(0, 0), goal=MazeLocation(9, 9),
+                 obstacles=[MazeLocation(3, 3), MazeLocation(9, 9)])
+        hierarchy = hierarchical.HierarchicalMaze(m, 4)
+        self.assertIsNone(hierarchy.distance(m.start, m.goal))
+        self.assertIsNone(hierarchy.path(MazeLocation(3, 3), m.start))
+
+    def test_astar_weighted(self):
+        # a detour of cheap moves beats one expensive move
+        moves = {'a': [('b', 1), ('d', 5)], 'b': [('c', 1)], 'c': [('d', 1)],
+                 'd': []}
+        solution = astar_weighted('a', 'd'.__eq__, moves.__getitem__,
+                                  lambda state: 0)
+        self.assertEqual(node_to_path(solution), ['a', 'b', 'c', 'd'])
+        self.assertEqual(solution.cost, 3)
+
+
+class SearchRegionTest(unittest.TestCase):
+    def test_holds_a_shortest_path(self):
+        origin = MazeLocation(0, 0)
+        for row in range(-6, 7):
+            for column in range(-6, 7):
+                goal = MazeLocation(row, column)
+                m = Maze(start=origin, goal=goal, obstacles=[])
+                m.region = m.search_region(knight_moves(row, column))
+                path = node_to_path(bfs(origin, m.goal_test, m.successors))
+                self.assertEqual(len(path) - 1, knight_moves(row, column))
+
+    def test_uncompiled_board(self):
+        almost_sealed = [(5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5), (8, 9)]
+        moves = KnightSolver(almost_sealed).attack((0, 0), (7, 7))
+        # too far apart for a grid, so the region search answers
+        huge = almost_sealed + [(3000, 3000)]
+        self.assertGreater(Maze(start=MazeLocation(0, 0), goal=MazeLocation(7, 7),
+                                obstacles=[MazeLocation(*o) for o in huge]).size,
+                           mazes.MAX_GRID_CELLS)
+        self.assertEqual(KnightSolver(huge).attack((0, 0), (7, 7)), moves)
+        self.assertIsNone(KnightSolver(huge + [(9, 8)]).attack((0, 0), (7, 7)))
+
+
+class SparseTest(unittest.TestCase):
+    almost_sealed = [(5, 6), (5, 8), (6, 5), (6, 9), (9, 6), (8, 5), (8, 9)]
+
+    def test_matches_attack(self):
+        for board in (KnightTest.basic, KnightTest.worst_case,
+                      KnightTest.walled_in, CompiledMazeTest.board,
+                      ReplanningTest.board):
+            start, dest, obstacles = data_builder(board)
+            self.assertEqual(sparse.SparseBoard(obstacles).distance(start, dest),
+                             KnightSolver(obstacles).attack(start, dest))
+        board = sparse.SparseBoard(SparseTest.almost_sealed)
+        solver = KnightSolver(SparseTest.almost_sealed)
+        for goal in ((7, 7), (6, 7), (40, -3), (-2, 12)):
+            self.assertEqual(board.distance((0, 0), goal),
+                             solver.attack((0, 0), goal))
+
+    def test_obstacle_on_some_shortest_paths(self):
+        # (12, 30) is on a shortest path, but (13, 33), (14, 35) gets past
+        self.assertEqual(sparse.SparseBoard([(12, 30)]).distance((11, 32), (15, 33)), 3)
+        self.assertEqual(sparse.SparseBoard([(4, 7)]).distance((2, 8), (3, 5)), 2)
+
+    def test_huge_coordinates(self):
+        # the same pocket near the start and millions of cells away
+        far = 3_000_000
+        obstacles = SparseTest.almost_sealed + \
+            [(row + far, column + far) for row, column in SparseTest.almost_sealed]
+        solver = KnightSolver(obstacles)
+        near = solver.attack((0, 0), (7, 7))
+        # getting into the far pocket costs as much over the open field
+        # distance as getting into the near one
+        self.assertEqual(solver.attack((0, 0), (far + 7, far + 7)) -
+                         knight_moves(far + 7, far + 7), near - knight_moves(7, 7))
+        solver.add_obstacle((far + 9, far + 8))
+        self.assertIsNone(solver.attack((0, 0), (far + 7, far + 7)))
+
+    def test_not_cached_as_exact(self):
+        far = 3_000_000
+        obstacles = SparseTest.almost_sealed + [(far, far)]
+        knights.result_cache.clear()
+        moves = attack((0, 0), (-far, 5), obstacles)
+        self.assertEqual(moves, knight_moves(-far, 5))
+        self.assertEqual(len(knights.result_cache), 1)  # the open field is exact
+        solver = KnightSolver(obstacles)
+        self.assertEqual(solver.attack((far + 7, far + 7), (7, 7)),
+                         attack((far + 7, far + 7), (7, 7), obstacles))
+        self.assertFalse(solver.exact)
+        self.assertEqual(len(knights.result_cache), 1)
+        solver.attack((7, 1), (3, 3))
+        self.assertTrue(solver.exact)
+
+    def test_flights_are_kept(self):
+        board = sparse.SparseBoard(SparseTest.almost_sealed + [(40, 40)])
+        moves = board.distance((-30, -30), (7, 7))
+        flights = len(board._flights)
+        self.assertGreater(flights, 0)
+        self.assertEqual(board.distance((-30, -30), (7, 7)), moves)
+        self.assertEqual(len(board._flights), flights)
+
+    def test_spatial_index(self):
+        locations = [MazeLocation(row, column) for row, column in
+                     ((0, 0), (5, 40), (-17, 3), (10 ** 9, -10 ** 9))]
+        index = mazes.SpatialIndex(locations, bucket_size=4)
+        self.assertEqual(set(index.within(MazeLocation(-20, -20),
+                                          MazeLocation(5, 40))),
+                         set(locations[:3]))
+        self.assertEqual(set(index.within(MazeLocation(-10 ** 10, -10 ** 10),
+                                          MazeLocation(10 ** 10, 10 ** 10))),
+                         set(locations))
+        index.remove(locations[0])
+        self.assertNotIn(locations[0], index)
+        self.assertEqual(list(index.within(locations[0], locations[0])), [])
+
+
+class KnightDistanceTest(unittest.TestCase):
+    def test_matches_bfs_on_open_board(self):
+        origin = MazeLocation(0, 0)
+        for row in range(-6, 7):
+            for column in range(-6, 7):
+                goal = MazeLocation(row, column)
+                # pad the corners far enough that the edges don't matter
+                m = Maze(start=MazeLocation(-10, -10), goal=goal,
+                         obstacles=[MazeLocation(10, 10)])
+                path = node_to_path(bfs(origin, m.goal_test, m.successors))
+                self.assertEqual(knight_moves(row, column), len(path) - 1)
 
 
 if __name__ == '__main__':
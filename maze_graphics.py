@@ -1,5 +1,7 @@
+from typing import Dict, Optional
 from graphics import GraphWin, Point, Rectangle
 from mazes import MazeLocation
+from generic_search import SearchHooks
 
 
 class MazeRect:
@@ -19,28 +21,45 @@ class MazeRect:
 
     def __init__(self, location: MazeLocation, type=None) -> None:
         self._location = location
-        self.type = type
+        self.type = None
         self._min_bound = Point(self._location.column * MazeRect.UNIT_SIZE,
                                 self._location.row * MazeRect.UNIT_SIZE)
         self._max_bound = Point((self._location.column + 1) * MazeRect.UNIT_SIZE,
                                 (self._location.row + 1) * MazeRect.UNIT_SIZE)
         self.rect = Rectangle(self._min_bound, self._max_bound)
         self.rect.setOutline(MazeRect.EDGE_COLOR)
+        self.rect.setWidth(MazeRect.EDGE_WEIGHT)
         self.set_type(type)
 
     def set_type(self, type):
+        """ Recolor the cell; each option set is a call into Tk once the
+        cell is drawn, so only the ones that change are set """
+        if type == self.type:
+            return
         self.rect.setFill(MazeRect.GRID_COLORS[type])
         if type == 'current':
             self.rect.setWidth(MazeRect.CURRENT_WEIGHT)
             self.rect.setOutline(MazeRect.CURRENT_OUTLINE)
-        else:
+        elif self.type == 'current':
             self.rect.setWidth(MazeRect.EDGE_WEIGHT)
             self.rect.setOutline(MazeRect.EDGE_COLOR)
+        self.type = type
 
 
-class MazeWin:
-    def __init__(self, maze):
+class MazeWin(SearchHooks[MazeLocation]):
+    """ Draws a maze, and animates any search it is passed to as hooks.
+
+    Pushes and expansions are collected as they happen, and each frame
+    only redraws the cells that changed since the one before, so a frame
+    costs as much as the search did in between rather than the size of
+    the frontier. A frame is drawn every steps_per_frame expansions.
+    """
+    def __init__(self, maze, steps_per_frame: int = 1):
         self.maze = maze
+        self.steps_per_frame = steps_per_frame
+        self._changes: Dict[MazeLocation, str] = {}  # location -> new type
+        self._current: Optional[MazeLocation] = None
+        self._steps = 0
         self._rows = self.maze.upper_limit.row # - self.maze.lower_limit.row
         self._columns = self.maze.upper_limit.column# - self.maze.lower_limit.column
         self._width = self._columns * MazeRect.UNIT_SIZE
@@ -55,7 +74,7 @@ class MazeWin:
                     loc_type = 'start'
                 elif loc == self.maze.goal:
                     loc_type = 'goal'
-                elif loc in self.maze.obstacles:
+                elif self.maze.is_obstacle(loc):
                     loc_type = 'obstacle'
                 else:
                     loc_type = 'empty'
@@ -76,14 +95,45 @@ class MazeWin:
         elif location not in [self.maze.start, self.maze.goal]:
             self.locations[location].set_type(new_type)
 
-    def show_search(self, current_state, frontier, explored=None):
-        self.update_location(current_state, 'current')
-        self.update_location(explored, 'explored')
-        for location in frontier.list():
-            self.update_location(location.state, 'frontier')
-
+    def on_push(self, node):
+        self._changes[node.state] = 'frontier'
+
+    def on_expand(self, node, frontier):
+        self.show_search(node.state)
+
+    def on_goal(self, node):
+        self._leave_current()
+        self.draw_changes()
+        self.show_path(node)
+
+    def on_exhausted(self):
+        self._leave_current()
+        self.draw_changes()
+
+    def show_search(self, current_state, explored=None):
+        self._leave_current()
+        self._changes[current_state] = 'current'
+        self._current = current_state
+        if explored is not None:
+            self._changes[explored] = 'explored'
+
+        self._steps += 1
+        if self._steps % self.steps_per_frame == 0:
+            self.draw_changes()
+
+    def draw_changes(self):
+        """ Redraw the cells changed since the last frame """
+        for location, new_type in self._changes.items():
+            self.update_location(location, new_type)
+        self._changes.clear()
         self._window.update()
-        self.update_location(current_state, 'explored')
+
+    def _leave_current(self):
+        # the cell expanded last is done with, unless it's been pushed again
+        if self._current is not None and \
+                self._changes.get(self._current) != 'frontier':
+            self._changes[self._current] = 'explored'
+        self._current = None
 
     def show_path(self, node):
         if not node:
@@ -1,7 +1,11 @@
-from typing import NamedTuple, List, Tuple, Optional
+from typing import NamedTuple, List, Tuple, Optional, Set, Iterator, Iterable, \
+    Dict
+from array import array
+import mmap
+import os
 from enum import Enum
 from math import sqrt
-from generic_search import astar, node_to_path
+from generic_search import bfs_distances_indexed
 
 
 # constants to use to display the cells in ASCII
@@ -19,6 +23,78 @@ class MazeLocation(NamedTuple):
     column: int
 
 
+# flat (CSR) adjacency of a compiled maze: the neighbors of cell i are
+# neighbors[offsets[i]:offsets[i + 1]]
+class Adjacency(NamedTuple):
+    offsets: array
+    neighbors: array
+
+
+# hard coded possible knight moves (8)
+KNIGHT_MOVES: Tuple[Tuple[int, int], ...] = \
+    ((2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1))
+
+# how far past the board limits the obstacle grid reaches, and with it
+# every search that isn't given a Maze.search_region(). Everything that
+# searches or compiles a padded board, or answers without searching,
+# ASSUMES that this is room enough for every shortest path between cells
+# of the board, so that the padding's edge never lengthens an answer or
+# cuts off a goal. That's borne out by cross checks against unbounded
+# searches, but not proven
+SEARCH_PAD = 3
+
+# boards whose padded area is larger than this keep their obstacles in a set
+# only, instead of allocating a grid for the whole area
+MAX_GRID_CELLS = 1 << 22
+
+# cells is_reachable() floods from start and goal together before leaving
+# the question to the search, on a board without component labels
+REACH_FLOOD_CELLS = 4096
+
+# board files at least this large are read through mmap
+MMAP_THRESHOLD = 1 << 20
+
+
+def knight_moves(d_row: int, d_column: int) -> int:
+    """ Exact number of knight moves needed to travel (d_row, d_column)
+    on an empty, unbounded board.
+
+    Obstacles and board edges can only make the trip longer, so this is an
+    admissible (and consistent) heuristic for the mazes below.
+    """
+    x: int = abs(d_row)
+    y: int = abs(d_column)
+    if x < y:
+        x, y = y, x
+    # the only two cases the formula below gets wrong
+    if x == 1 and y == 0:
+        return 3
+    if x == 2 and y == 2:
+        return 4
+    delta: int = x - y
+    if y > delta:
+        return delta - 2 * ((delta - y) // 3)
+    return delta - 2 * ((delta - y) // 4)
+
+
+def path_region(start: MazeLocation, goal: MazeLocation,
+                bound: int) -> Tuple[MazeLocation, MazeLocation]:
+    """ The smallest box holding every path of at most bound moves from
+    start to goal, as (lower, upper) corners, both included.
+
+    A move changes the row by 2 at most, so a path that goes e rows past
+    the rows of start and goal travels at least |d_row| + 2e rows and takes
+    at least that over 2 moves: e <= bound - ceil(|d_row| / 2). The same
+    goes for the columns.
+    """
+    rows: int = bound - (abs(goal.row - start.row) + 1) // 2
+    columns: int = bound - (abs(goal.column - start.column) + 1) // 2
+    return (MazeLocation(min(start.row, goal.row) - rows,
+                         min(start.column, goal.column) - columns),
+            MazeLocation(max(start.row, goal.row) + rows,
+                         max(start.column, goal.column) + columns))
+
+
 class Maze:
     def __init__(self, data_string: Optional[str] = None,
                  start: Optional[MazeLocation] = None,
@@ -33,65 +109,230 @@ class Maze:
                                 'and/or goal!')
             self.start: Optional[MazeLocation] = start
             self.goal: Optional[MazeLocation] = goal
-            self.obstacles: Optional[List[MazeLocation]] = obstacles
+            self.obstacles: List[MazeLocation] = \
+                list(obstacles) if obstacles is not None else []
             self._set_limits()
+        self._build_obstacle_index()
+        self._adjacency: Optional[Adjacency] = None
+        self._components: Optional[array] = None
+        # bumped on every change to the obstacles
+        self.version: int = 0
+        # (lower, upper) corners, both included, that successors() keeps to
+        # instead of the padded limits, see search_region()
+        self.region: Optional[Tuple[MazeLocation, MazeLocation]] = None
 
     def successors(self, start: MazeLocation,
                    ignore_obstacles: Optional[bool] = False) -> List[MazeLocation]:
         locations: List[MazeLocation] = []
-        # hard coded possible knight moves (8)
-        possible_moves: List[Tuple] = \
-            [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
-        for m in possible_moves:
-            new_location: MazeLocation = MazeLocation(start.row + m[0],
-                                                      start.column + m[1])
-            if new_location in self.obstacles and not ignore_obstacles:
+        if self.region is not None:
+            lower, upper = self.region
+            for dr, dc in KNIGHT_MOVES:
+                new_location = MazeLocation(start.row + dr, start.column + dc)
+                if new_location.row < lower.row or new_location.row > upper.row or \
+                        new_location.column < lower.column or \
+                        new_location.column > upper.column:
+                    continue
+                if not ignore_obstacles and self.is_obstacle(new_location):
+                    continue
+                locations.append(new_location)
+            return locations
+
+        grid = self._grid
+        if grid is None:
+            for dr, dc in KNIGHT_MOVES:
+                new_location = MazeLocation(start.row + dr, start.column + dc)
+                if not ignore_obstacles and new_location in self._sparse_obstacles:
+                    continue
+                elif not self._is_in_limits(new_location, pad=SEARCH_PAD):
+                    continue
+                locations.append(new_location)
+            return locations
+
+        # the grid spans exactly the padded limits, so the bounds check on
+        # grid coordinates doubles as the limits check
+        rows: int = self._grid_rows
+        columns: int = self._grid_columns
+        r0: int = start.row - self._grid_origin.row
+        c0: int = start.column - self._grid_origin.column
+        for dr, dc in KNIGHT_MOVES:
+            r = r0 + dr
+            c = c0 + dc
+            if r < 0 or r >= rows or c < 0 or c >= columns:
                 continue
-            elif not self._is_in_limits(new_location, pad=3):
+            if grid[r * columns + c] and not ignore_obstacles:
                 continue
-            else:
-                locations.append(new_location)
+            locations.append(MazeLocation(start.row + dr, start.column + dc))
 
         return locations
 
+    def compile(self) -> Adjacency:
+        """ Build (once) the knight move adjacency of every cell in the grid.
+
+        Cells are numbered like the obstacle grid, see location_index().
+        Obstacles get no neighbors and never appear as one.
+        """
+        if self._adjacency is not None:
+            return self._adjacency
+        if self._grid is None:
+            raise Exception('Error: Maze is too large to compile')
+
+        grid: bytearray = self._grid
+        rows: int = self._grid_rows
+        columns: int = self._grid_columns
+        offsets: array = array('i', [0])
+        neighbors: array = array('i')
+        for r in range(rows):
+            for c in range(columns):
+                if not grid[r * columns + c]:
+                    for dr, dc in KNIGHT_MOVES:
+                        nr = r + dr
+                        nc = c + dc
+                        if 0 <= nr < rows and 0 <= nc < columns \
+                                and not grid[nr * columns + nc]:
+                            neighbors.append(nr * columns + nc)
+                offsets.append(len(neighbors))
+
+        self._adjacency = Adjacency(offsets, neighbors)
+        return self._adjacency
+
+    def components(self) -> array:
+        """ Label every cell of the compiled maze with the number of its
+        knight-move connected component (-1 for obstacles).
+
+        Computed once per maze: two cells are reachable from each other
+        exactly when their labels match.
+        """
+        if self._components is not None:
+            return self._components
+
+        offsets, neighbors = self.compile()
+        labels: array = array('i', [-1]) * self.size
+        label: int = 0
+        for cell in range(self.size):
+            if labels[cell] >= 0 or offsets[cell] == offsets[cell + 1]:
+                continue  # labelled already, or an obstacle / isolated cell
+            labels[cell] = label
+            stack: List[int] = [cell]
+            while stack:
+                current = stack.pop()
+                for k in range(offsets[current], offsets[current + 1]):
+                    child = neighbors[k]
+                    if labels[child] < 0:
+                        labels[child] = label
+                        stack.append(child)
+            label += 1
+
+        self._components = labels
+        return labels
+
+    def distance_field(self, goal: Optional[MazeLocation] = None) -> array:
+        """ Number of moves from every cell of the compiled maze to goal
+        (-1 where it can't be reached), indexed like location_index() """
+        goal = goal if goal is not None else self.goal
+        return bfs_distances_indexed(self._cell_index(goal), *self.compile())
+
+    def is_reachable(self, start: Optional[MazeLocation] = None,
+                     goal: Optional[MazeLocation] = None) -> bool:
+        """ Cheap test for whether any path from start to goal can exist.
+
+        A start or goal with no free knight moves is sealed off. Once the
+        component labels are built (see components()) they settle the rest;
+        until then, start and goal are flooded from together, and if one
+        side runs out of cells before they meet, the goal is unreachable.
+        Past REACH_FLOOD_CELLS cells, the question is left to the search.
+        """
+        start = start if start is not None else self.start
+        goal = goal if goal is not None else self.goal
+        if start == goal:
+            return True
+        if self.is_obstacle(goal):
+            return False
+        if not self.successors(goal) or not self.successors(start):
+            return False
+        if self._components is not None and not self.is_obstacle(start):
+            labels: array = self._components
+            return labels[self._cell_index(start)] == labels[self._cell_index(goal)]
+
+        # moves are symmetric, except into an obstacle start, which the
+        # flood from goal therefore meets at one of start's moves instead
+        seen: Tuple[Set[MazeLocation], Set[MazeLocation]] = ({start}, {goal})
+        layers: Tuple[List[MazeLocation], List[MazeLocation]] = ([start], [goal])
+        while layers[0] and layers[1]:
+            if len(seen[0]) + len(seen[1]) > REACH_FLOOD_CELLS:
+                return True
+            side: int = 0 if len(layers[0]) <= len(layers[1]) else 1
+            next_layer: List[MazeLocation] = []
+            for location in layers[side]:
+                for next_location in self.successors(location):
+                    if next_location in seen[1 - side]:
+                        return True
+                    if next_location not in seen[side]:
+                        seen[side].add(next_location)
+                        next_layer.append(next_location)
+            layers = (next_layer, layers[1]) if side == 0 else (layers[0], next_layer)
+        return False
+
+    def search_region(self, bound: int, start: Optional[MazeLocation] = None,
+                      goal: Optional[MazeLocation] = None
+                      ) -> Tuple[MazeLocation, MazeLocation]:
+        """ The smallest box holding every path of at most bound moves
+        from start to goal (by default the maze's own), see path_region() """
+        return path_region(start if start is not None else self.start,
+                           goal if goal is not None else self.goal, bound)
+
+    def padded_region(self) -> Tuple[MazeLocation, MazeLocation]:
+        """ The region successors() keeps to without a search_region():
+        the limits and SEARCH_PAD around them """
+        return (MazeLocation(self.lower_limit.row - SEARCH_PAD,
+                             self.lower_limit.column - SEARCH_PAD),
+                MazeLocation(self.upper_limit.row + SEARCH_PAD,
+                             self.upper_limit.column + SEARCH_PAD))
+
+    @property
+    def grid_shape(self) -> Tuple[int, int]:
+        """ (rows, columns) of the obstacle grid """
+        return self._grid_rows, self._grid_columns
+
+    def obstacle_grid(self) -> bytearray:
+        """ The obstacle grid itself, one byte per cell in location_index()
+        order, 1 for obstacles. Don't modify it, use add_obstacle(). """
+        if self._grid is None:
+            raise Exception('Error: Maze is too large for a grid')
+        return self._grid
+
+    @property
+    def size(self) -> int:
+        """ Number of cells in the obstacle grid """
+        return self._grid_rows * self._grid_columns
+
+    def location_index(self, location: MazeLocation) -> int:
+        """ Cell number of a location in the compiled maze, -1 if outside """
+        return self._cell_index(location)
+
+    def index_location(self, index: int) -> MazeLocation:
+        row, column = divmod(index, self._grid_columns)
+        return MazeLocation(row + self._grid_origin.row,
+                            column + self._grid_origin.column)
+
     def successors_no_obst(self, start):
         return self.successors(start, ignore_obstacles=True)
 
     def knight_distance(self):
         def distance(ml: MazeLocation) -> int:
-            xdist: int = abs(ml.column - self.goal.column)
-            ydist: int = abs(ml.row - self.goal.row)
-            if xdist == ydist and xdist < 3:
-                return 4
-            elif xdist == 0 or ydist == 0:
-                if xdist + ydist == 1:
-                    return 3
-                elif xdist + ydist == 2:
-                    return 2
-                elif xdist + ydist == 3:
-                    return 5
-                elif xdist + ydist == 4:
-                    return 2
-                else:
-                    # approximate
-                    return (xdist + ydist) // 2
-            elif xdist == 2 and yddist == 1 or xdist == 1 and ydist == 2:
-                return 1
-            else:
-                # approximatee
-                return (xdist + ydist) // 2
+            return knight_moves(ml.row - self.goal.row,
+                                ml.column - self.goal.column)
 
         return distance
 
-    def knight_distance_recursive(self):
-        # TODO: Write better heuristic for knights movement
-        #   This one isn't very good, and takes a long time.
-        def distance(ml: MazeLocation) -> int:
-            d = self.euclidian_distance()
-            sol: Node[T] = astar(ml, self.goal_test,
-                                 self.successors_no_obst, d)
-            path: List[T] = node_to_path(sol)
-            return len(path)
+    def knight_distance_indexed(self, goal: Optional[MazeLocation] = None):
+        """ knight_distance() for the cell numbers of the compiled maze """
+        columns: int = self._grid_columns
+        goal_row, goal_column = divmod(
+            self._cell_index(goal if goal is not None else self.goal), columns)
+
+        def distance(index: int) -> int:
+            row, column = divmod(index, columns)
+            return knight_moves(row - goal_row, column - goal_column)
 
         return distance
 
@@ -106,6 +347,74 @@ class Maze:
     def goal_test(self, location: MazeLocation):
         return location == self.goal
 
+    def is_obstacle(self, location: MazeLocation) -> bool:
+        index: int = self._cell_index(location)
+        if index >= 0:
+            return self._grid[index] == 1
+        return location in self._sparse_obstacles
+
+    def add_obstacle(self, location: MazeLocation) -> None:
+        """ Block location. The limits of the maze stay as they are. """
+        if self.is_obstacle(location):
+            return
+        self.obstacles.append(location)
+        index: int = self._cell_index(location)
+        if index >= 0:
+            self._grid[index] = 1
+        else:
+            self._sparse_obstacles.add(location)
+        self._obstacles_changed()
+
+    def remove_obstacle(self, location: MazeLocation) -> None:
+        if not self.is_obstacle(location):
+            return
+        self.obstacles.remove(location)
+        index: int = self._cell_index(location)
+        if index >= 0:
+            self._grid[index] = 0
+        else:
+            self._sparse_obstacles.discard(location)
+        self._obstacles_changed()
+
+    def _obstacles_changed(self) -> None:
+        self._adjacency = None
+        self._components = None
+        self.version += 1
+
+    def _cell_index(self, location: MazeLocation) -> int:
+        """ Index of a location in the obstacle grid, or -1 if it has none """
+        if self._grid is None:
+            return -1
+        r: int = location.row - self._grid_origin.row
+        c: int = location.column - self._grid_origin.column
+        if r < 0 or r >= self._grid_rows or c < 0 or c >= self._grid_columns:
+            return -1
+        return r * self._grid_columns + c
+
+    def _build_obstacle_index(self) -> None:
+        """ Mark the obstacles in a grid covering the padded limits.
+
+        Obstacles that fall outside of the grid (or every obstacle, if the
+        board is too large for a grid) are kept in a set instead.
+        """
+        self._grid_origin = MazeLocation(self.lower_limit.row - SEARCH_PAD,
+                                         self.lower_limit.column - SEARCH_PAD)
+        self._grid_rows: int = \
+            self.upper_limit.row - self.lower_limit.row + 2 * SEARCH_PAD + 1
+        self._grid_columns: int = \
+            self.upper_limit.column - self.lower_limit.column + 2 * SEARCH_PAD + 1
+        self._grid: Optional[bytearray] = None
+        if self._grid_rows * self._grid_columns <= MAX_GRID_CELLS:
+            self._grid = bytearray(self._grid_rows * self._grid_columns)
+        self._sparse_obstacles: Set[MazeLocation] = set()
+
+        for o in self.obstacles:
+            index = self._cell_index(o)
+            if index >= 0:
+                self._grid[index] = 1
+            else:
+                self._sparse_obstacles.add(o)
+
     def _is_in_limits(self, location: MazeLocation, pad: int = 0) -> bool:
         row: int = location.row
         column: int = location.column
@@ -153,16 +462,130 @@ class Maze:
 
     def __str__(self) -> str:
         board_str = ''
-        for r in range(self.size.row):
-            for c in range(self.size.column):
+        for r in range(self.lower_limit.row, self.upper_limit.row):
+            for c in range(self.lower_limit.column, self.upper_limit.column):
                 position = MazeLocation(r, c)
                 if position == self.start:
                     board_str += ''.join(Cell.START.value)
                 elif position == self.goal:
                     board_str += ''.join(Cell.GOAL.value)
-                elif position in self.obstacles:
+                elif self.is_obstacle(position):
                     board_str += ''.join(Cell.BLOCKED.value)
                 else:
                     board_str += ''.join(Cell.EMPTY.value)
             board_str += '\n'
         return board_str
+
+
+class SpatialIndex:
+    """ Locations hashed into square buckets, for finding the few of them
+    inside a box however far apart they are spread """
+
+    def __init__(self, locations: Iterable[MazeLocation],
+                 bucket_size: int = 16) -> None:
+        self.bucket_size: int = bucket_size
+        self._buckets: Dict[Tuple[int, int], List[MazeLocation]] = {}
+        self._locations: Set[MazeLocation] = set()
+        for location in locations:
+            self.add(location)
+
+    def add(self, location: MazeLocation) -> None:
+        if location in self._locations:
+            return
+        self._locations.add(location)
+        self._buckets.setdefault(self._bucket(location), []).append(location)
+
+    def remove(self, location: MazeLocation) -> None:
+        if location not in self._locations:
+            return
+        self._locations.remove(location)
+        bucket: Tuple[int, int] = self._bucket(location)
+        self._buckets[bucket].remove(location)
+        if not self._buckets[bucket]:
+            del self._buckets[bucket]
+
+    def __contains__(self, location: MazeLocation) -> bool:
+        return location in self._locations
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __iter__(self) -> Iterator[MazeLocation]:
+        return iter(self._locations)
+
+    def within(self, lower: MazeLocation,
+               upper: MazeLocation) -> Iterator[MazeLocation]:
+        """ The locations in the box from lower to upper, both included """
+        low_row, low_column = self._bucket(lower)
+        high_row, high_column = self._bucket(upper)
+        buckets: List[List[MazeLocation]]
+        if (high_row - low_row + 1) * (high_column - low_column + 1) > \
+                len(self._buckets):
+            # a huge box: cheaper to go through the buckets there are
+            buckets = [locations
+                       for (row, column), locations in self._buckets.items()
+                       if low_row <= row <= high_row and
+                       low_column <= column <= high_column]
+        else:
+            buckets = [self._buckets[(row, column)]
+                       for row in range(low_row, high_row + 1)
+                       for column in range(low_column, high_column + 1)
+                       if (row, column) in self._buckets]
+        for locations in buckets:
+            for location in locations:
+                if lower.row <= location.row <= upper.row and \
+                        lower.column <= location.column <= upper.column:
+                    yield location
+
+    def _bucket(self, location: MazeLocation) -> Tuple[int, int]:
+        return location.row // self.bucket_size, location.column // self.bucket_size
+
+
+def read_mazes(path: str) -> Iterator[Maze]:
+    """ Yield the mazes of a board file one at a time, see read_boards() """
+    for _, board in read_boards(path):
+        yield Maze(board)
+
+
+def read_boards(path: str, start: int = 0,
+                end: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """ Yield (byte offset, board) for the boards of a file, lazily.
+
+    Boards are separated by empty lines or by header lines starting with
+    '#'. A line in the tuple format of knights.attack(), starting with
+    '(', is a board of its own. With start and end, only the boards
+    beginning in that byte range are read. Large files are read through
+    mmap, so only the pages being parsed are ever in memory.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            source = f  # (mmap can't map an empty file anyway)
+        try:
+            source.seek(start)
+            offset: int = start
+            board_offset: int = start
+            rows: List[str] = []
+            while end is None or offset < end or rows:
+                line: bytes = source.readline()
+                if not line:
+                    break
+                row: str = line.rstrip(b'\r\n').decode()
+                single: bool = row.lstrip().startswith('(')
+                if not row or row.startswith('#') or single:
+                    if rows:
+                        yield board_offset, '\n'.join(rows)
+                        rows = []
+                    if single and (end is None or offset < end):
+                        yield offset, row
+                else:
+                    if not rows:
+                        board_offset = offset
+                    rows.append(row)
+                offset += len(line)
+            if rows:
+                yield board_offset, '\n'.join(rows)
+        finally:
+            if source is not f:
+                source.close()
@@ -0,0 +1,311 @@
+""" Knight distances on boards spread over huge coordinates
+
+When start and goal are millions of cells apart with a few hundred
+obstacles between them, nothing the size of the board can be allocated or
+searched. Instead, the obstacles are gathered into clusters, each in a box
+with a margin of free cells around it, and only the boxes get searched
+cell by cell. The cells in the outer two rings of a box (a knight lands in
+those when it jumps in from outside) are waypoints. Away from the boxes
+the board is empty, so between two waypoints with no obstacle on any
+shortest path, the closed-form knight_moves() is the distance. A search
+over the waypoints, joined by those free flights and by the paths inside
+the boxes, takes time and memory that depend on the obstacles and not on
+how far apart things are. Which flights are free is worked out once per
+board, as searches first need it.
+
+A flight with obstacles on some of its shortest paths is searched cell by
+cell inside its "ellipse" when that is small, to find whether any of them
+gets past. A longer one is left to go through the waypoints of the
+obstacles' boxes instead, which can cost more. The distance found is
+always that of a real path. It is the shortest one whenever it equals the
+closed form, and in the layouts tested, but it isn't proven to be in
+general, so KnightSolver doesn't count it as exact.
+"""
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+from generic_search import astar_weighted, SearchStats
+from mazes import MazeLocation, SpatialIndex, KNIGHT_MOVES, knight_moves, \
+    path_region
+
+Box = Tuple[MazeLocation, MazeLocation]  # lower and upper corners, included
+Edge = Tuple[MazeLocation, int]  # (location, moves)
+
+
+class SparseBoard:
+    # past this many times the closed-form distance, the search gives up
+    # pruning waypoints and goes through all of them
+    BOUND_LIMIT = 4
+    # 1 + less than one over the most moves a search is expected to need
+    TIE_BREAK = 1 + 1e-9
+    # the largest region of a flight that gets searched when obstacles are
+    # on some of its shortest paths, see _flight_around()
+    LOCAL_FLIGHT_CELLS = 1024
+
+    def __init__(self, obstacles: Iterable[Tuple], margin: int = 2) -> None:
+        self.obstacles: SpatialIndex = SpatialIndex(
+            MazeLocation(row=o[0], column=o[1]) for o in obstacles)
+        self.boxes: List[Box] = _boxes(self.obstacles, margin)
+        self._rings: List[List[MazeLocation]] = [_ring(box) for box in self.boxes]
+        self._box_of: Dict[MazeLocation, int] = {}  # waypoint -> box
+        for n, ring in enumerate(self._rings):
+            for location in ring:
+                self._box_of[location] = n
+        self.waypoints: SpatialIndex = SpatialIndex(self._box_of)
+        self._centers: List[MazeLocation] = [
+            MazeLocation((lower.row + upper.row) // 2,
+                         (lower.column + upper.column) // 2)
+            for lower, upper in self.boxes]
+        # moves from the center of a box to the farthest of its waypoints
+        self._radii: List[int] = [
+            max(_moves(center, location) for location in ring)
+            for center, ring in zip(self._centers, self._rings)]
+        self._local_moves: Dict[MazeLocation, Dict[MazeLocation, int]] = {}
+        # (box, box) -> obstacles that may be in the way between them
+        self._blockers: Dict[Tuple[int, int], List[MazeLocation]] = {}
+        # (waypoint, box) -> free flights to the waypoints of the box
+        self._flights: Dict[Tuple[MazeLocation, int], List[Edge]] = {}
+
+    def distance(self, start: Tuple, goal: Tuple,
+                 stats: Optional[SearchStats] = None) -> Optional[int]:
+        """ Number of moves from start to goal, None if unreachable """
+        start = MazeLocation(row=start[0], column=start[1])
+        goal = MazeLocation(row=goal[0], column=goal[1])
+        if start == goal:
+            return 0
+        if goal in self.obstacles:
+            return None
+        direct: int = _moves(start, goal)
+        if start not in self.obstacles and self._free_flight(start, goal):
+            return direct
+
+        # as in knights._search, waypoints that can't be on a path of up to
+        # bound moves are left out, and the bound grows until it holds a path
+        bound: Optional[int] = direct
+        while True:
+            moves: Optional[int] = self._search(start, goal, bound, stats)
+            if moves is not None and (bound is None or moves <= bound):
+                return moves
+            if moves is not None:
+                bound = moves
+            elif bound is None:
+                return None
+            elif bound > SparseBoard.BOUND_LIMIT * direct:
+                bound = None
+            else:
+                bound *= 2
+
+    def _search(self, start: MazeLocation, goal: MazeLocation,
+                bound: Optional[int], stats: Optional[SearchStats]) -> Optional[int]:
+        def detour(location: MazeLocation) -> int:
+            return _moves(start, location) + _moves(location, goal)
+
+        if bound is None:
+            candidates: List[MazeLocation] = list(self.waypoints)
+        else:
+            # a box first, to look up, then the "ellipse" inside of it
+            candidates = [location for location in
+                          self.waypoints.within(*path_region(start, goal, bound))
+                          if detour(location) <= bound]
+        candidate_set: Set[MazeLocation] = set(candidates)
+        candidate_boxes: Set[int] = {self._box_of[location]
+                                     for location in candidates}
+
+        # start and goal inside a box join the waypoints of their box
+        start_edges: List[Edge] = []
+        start_box: Optional[int] = self._box_containing(start)
+        if start_box is not None:
+            start_edges = [(location, moves) for location, moves
+                           in self._local(start, start_box).items()
+                           if location in self._box_of or location == goal]
+        to_goal: Dict[MazeLocation, int] = {}
+        goal_box: Optional[int] = self._box_containing(goal)
+        if goal_box is not None:
+            to_goal = self._local(goal, goal_box)
+
+        def successors(location: MazeLocation) -> List[Edge]:
+            if location == start:
+                edges: List[Edge] = list(start_edges)
+                if location not in self.obstacles:
+                    edges.extend((other, _moves(location, other))
+                                 for other in candidates
+                                 if self._free_flight(location, other))
+            else:
+                box: int = self._box_of[location]
+                edges = list(self._local(location, box).items())
+                for other_box in candidate_boxes:
+                    edges.extend(edge for edge in
+                                 self._box_flights(location, other_box)
+                                 if edge[0] in candidate_set)
+            if location in to_goal:
+                edges.append((goal, to_goal[location]))
+            if location not in self.obstacles and \
+                    self._free_flight(location, goal):
+                edges.append((goal, _moves(location, goal)))
+            return edges
+
+        def heuristic(location: MazeLocation) -> float:
+            # a shade over the moves left, so that of the many waypoints an
+            # open board ties on, the ones nearest the goal go first; costs
+            # being whole moves, no path a move longer can win that way
+            return _moves(location, goal) * SparseBoard.TIE_BREAK
+
+        solution = astar_weighted(start, goal.__eq__, successors, heuristic, stats)
+        return int(solution.cost) if solution is not None else None
+
+    def _free_flight(self, a: MazeLocation, b: MazeLocation) -> bool:
+        """ Whether some shortest path of the open board from a to b
+        misses every obstacle """
+        if a == b:
+            return False
+        moves: int = _moves(a, b)
+        for o in self.obstacles.within(*path_region(a, b, moves)):
+            if _moves(a, o) + _moves(o, b) <= moves:
+                return self._flight_around(a, b, moves)
+        return True
+
+    def _flight_around(self, a: MazeLocation, b: MazeLocation,
+                       moves: int) -> bool:
+        """ Whether a path of moves moves from a to b gets past the
+        obstacles on some of the shortest paths between them.
+
+        Only the cells of the "ellipse" need searching, the ones a shortest
+        path can go through; past LOCAL_FLIGHT_CELLS of them (a long flight)
+        the answer is no, and the search goes around by the waypoints.
+        """
+        lower, upper = path_region(a, b, moves)
+        if (upper.row - lower.row + 1) * (upper.column - lower.column + 1) > \
+                SparseBoard.LOCAL_FLIGHT_CELLS:
+            return False
+        seen: Set[MazeLocation] = {a}
+        stack: List[Edge] = [(a, 0)]  # (location, moves from a)
+        while stack:
+            location, so_far = stack.pop()
+            for dr, dc in KNIGHT_MOVES:
+                next_location = MazeLocation(location.row + dr, location.column + dc)
+                if next_location in seen or next_location in self.obstacles or \
+                        so_far + 1 + _moves(next_location, b) > moves:
+                    continue
+                if next_location == b:
+                    return True
+                seen.add(next_location)
+                stack.append((next_location, so_far + 1))
+        return False
+
+    def _box_flights(self, a: MazeLocation, other: int) -> List[Edge]:
+        """ The free flights from waypoint a to the waypoints of box other,
+        worked out once for the board.
+
+        Knight moves are a distance, so moving a or b by at most r moves
+        changes moves(a, o) + moves(o, b) - moves(a, b) by at most 2r. An
+        obstacle that is far enough off the "ellipse" between the centers
+        of two boxes can't be on a shortest path between any of their
+        waypoints, and only the few that aren't get checked pair by pair.
+        """
+        if (a, other) in self._flights:
+            return self._flights[a, other]
+        box: int = self._box_of[a]
+        if (box, other) not in self._blockers:
+            center, other_center = self._centers[box], self._centers[other]
+            reach: int = _moves(center, other_center) + \
+                2 * (self._radii[box] + self._radii[other])
+            self._blockers[box, other] = [
+                o for o in self.obstacles.within(
+                    *path_region(center, other_center, reach))
+                if _moves(center, o) + _moves(o, other_center) <= reach]
+
+        other_center = self._centers[other]
+        reach = _moves(a, other_center) + 2 * self._radii[other]
+        near: List[Edge] = []  # (obstacle, moves from a)
+        for o in self._blockers[box, other]:
+            to_o: int = _moves(a, o)
+            if to_o + _moves(o, other_center) <= reach:
+                near.append((o, to_o))
+        edges: List[Edge] = []
+        for b in self._rings[other]:
+            if b == a:
+                continue
+            moves: int = _moves(a, b)
+            for o, to_o in near:
+                if to_o + _moves(o, b) <= moves:
+                    if self._flight_around(a, b, moves):
+                        edges.append((b, moves))
+                    break
+            else:
+                edges.append((b, moves))
+        self._flights[a, other] = edges
+        return edges
+
+    def _box_containing(self, location: MazeLocation) -> Optional[int]:
+        if location in self._box_of:
+            return self._box_of[location]
+        for n, (lower, upper) in enumerate(self.boxes):
+            if lower.row <= location.row <= upper.row and \
+                    lower.column <= location.column <= upper.column:
+                return n
+        return None
+
+    def _local(self, source: MazeLocation, box: int) -> Dict[MazeLocation, int]:
+        """ Moves from source to everything it reaches without leaving its
+        box; for a waypoint, only to the other waypoints """
+        if source in self._local_moves:
+            return self._local_moves[source]
+        lower, upper = self.boxes[box]
+        distances: Dict[MazeLocation, int] = {source: 0}
+        frontier: Deque[MazeLocation] = deque([source])
+        while frontier:
+            current: MazeLocation = frontier.popleft()
+            for dr, dc in KNIGHT_MOVES:
+                location = MazeLocation(current.row + dr, current.column + dc)
+                if lower.row <= location.row <= upper.row and \
+                        lower.column <= location.column <= upper.column and \
+                        location not in distances and location not in self.obstacles:
+                    distances[location] = distances[current] + 1
+                    frontier.append(location)
+        del distances[source]
+        if source in self._box_of:  # start and goal change with every query
+            distances = {location: moves for location, moves in distances.items()
+                         if location in self._box_of}
+            self._local_moves[source] = distances
+        return distances
+
+
+def _moves(a: MazeLocation, b: MazeLocation) -> int:
+    return knight_moves(b.row - a.row, b.column - a.column)
+
+
+def _boxes(obstacles: SpatialIndex, margin: int) -> List[Box]:
+    """ Boxes around the clusters of obstacles, merged until none overlap """
+    boxes: List[Box] = []
+    for o in obstacles:
+        boxes.append((MazeLocation(o.row - margin, o.column - margin),
+                      MazeLocation(o.row + margin, o.column + margin)))
+    merged: bool = True
+    while merged:
+        merged = False
+        boxes.sort()
+        kept: List[Box] = []
+        for lower, upper in boxes:
+            for n, (other_lower, other_upper) in enumerate(kept):
+                if lower.row <= other_upper.row and other_lower.row <= upper.row and \
+                        lower.column <= other_upper.column and \
+                        other_lower.column <= upper.column:
+                    kept[n] = (MazeLocation(min(lower.row, other_lower.row),
+                                            min(lower.column, other_lower.column)),
+                               MazeLocation(max(upper.row, other_upper.row),
+                                            max(upper.column, other_upper.column)))
+                    merged = True
+                    break
+            else:
+                kept.append((lower, upper))
+        boxes = kept
+    return boxes
+
+
+def _ring(box: Box) -> List[MazeLocation]:
+    """ The cells of the outer two rings of a box """
+    lower, upper = box
+    return [MazeLocation(row, column)
+            for row in range(lower.row, upper.row + 1)
+            for column in range(lower.column, upper.column + 1)
+            if row - lower.row < 2 or upper.row - row < 2 or
+            column - lower.column < 2 or upper.column - column < 2]
@@ -0,0 +1,72 @@
+""" Breadth-first search of a whole maze at a time with numpy
+
+Instead of expanding one cell after another, each step moves the entire
+frontier (a boolean array) by all 8 knight moves at once, which keeps the
+per-cell work inside numpy. That pays off on big, open boards, where bfs
+spends its time in the Python loop.
+"""
+from typing import Optional, Tuple, Union
+from mazes import Maze, MazeLocation, KNIGHT_MOVES
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for this engine
+    np = None
+
+
+def free_cells(maze: Maze):
+    """ Boolean array over the obstacle grid, True where a knight may land """
+    if np is None:
+        raise ImportError('the wavefront engine needs numpy')
+    grid = np.frombuffer(maze.obstacle_grid(), dtype=np.uint8)
+    return grid.reshape(maze.grid_shape) == 0
+
+
+def wavefront(maze: Maze, start: Optional[MazeLocation] = None,
+              goal: Optional[MazeLocation] = None,
+              layers: bool = False) -> Union[Optional[int], Tuple]:
+    """ Number of moves from start to goal (None if unreachable).
+
+    With layers=True, returns (moves, layer_map) instead, where layer_map
+    holds the number of moves to every cell searched and -1 elsewhere.
+    The search stops at the goal's layer, unless goal is None, in which
+    case it maps everything reachable from start.
+    """
+    start = start if start is not None else maze.start
+    free = free_cells(maze)
+    rows, columns = free.shape
+    start_cell: Tuple[int, int] = divmod(maze.location_index(start), columns)
+    goal_cell: Optional[Tuple[int, int]] = None
+    if goal is not None:
+        goal_cell = divmod(maze.location_index(goal), columns)
+
+    frontier = np.zeros_like(free)
+    frontier[start_cell] = True
+    visited = frontier.copy()
+    layer_map = None
+    if layers:
+        layer_map = np.full(free.shape, -1, dtype=np.int16 if free.size < 2 ** 15
+                            else np.int32)
+        layer_map[start_cell] = 0
+
+    moves: int = 0
+    found: Optional[int] = 0 if start_cell == goal_cell else None
+    while found is None and frontier.any():
+        moves += 1
+        reached = np.zeros_like(free)
+        for dr, dc in KNIGHT_MOVES:
+            # reached[r + dr, c + dc] |= frontier[r, c], clipped to the grid
+            reached[max(dr, 0):rows + min(dr, 0), max(dc, 0):columns + min(dc, 0)] |= \
+                frontier[max(-dr, 0):rows - max(dr, 0), max(-dc, 0):columns - max(dc, 0)]
+        reached &= free
+        reached &= ~visited
+        visited |= reached
+        if layers:
+            layer_map[reached] = moves
+        if goal_cell is not None and reached[goal_cell]:
+            found = moves
+        frontier = reached
+
+    if layers:
+        return found, layer_map
+    return found